@@ -0,0 +1,202 @@
+"""Run Job.get_tasks and Cost.get_data end to end against a synthetic bucket
+served by moto, and report throughput, memory and latency.
+
+    pip install -r benchmark/requirements.txt
+    cd src && python ../benchmark/bench_get_data.py --accounts 4 --months 3 \\
+        --rows 200000 --option prefetch_size=8 --option output_format='"model"'
+
+Every --option is a data source option whose value is parsed as JSON.
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import boto3
+from dateutil.relativedelta import relativedelta
+from moto import mock_aws
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from billing_bucket import generate_bucket, parse_service_mix
+from plugin.manager.cost_manager import CostManager
+from plugin.manager.job_manager import JobManager
+
+_BUCKET = "hyperbilling-benchmark"
+_DATABASE = "BENCH"
+_SECRET_DATA = {
+    "aws_access_key_id": "testing",
+    "aws_secret_access_key": "testing",
+    "aws_s3_bucket": _BUCKET,
+    "region_name": "us-east-1",
+}
+
+
+def main():
+    args = _parse_args()
+    options = {"task_type": "directory", "database": _DATABASE, **args.options}
+
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=_BUCKET)
+
+        months = _get_months(args.months)
+        bucket_stats = generate_bucket(
+            s3_client,
+            _BUCKET,
+            _DATABASE,
+            [f"{100000000000 + index}" for index in range(args.accounts)],
+            months,
+            args.rows,
+            args.objects_per_month,
+            args.tag_cardinality,
+            args.tags_per_row,
+            args.service_mix,
+            seed=args.seed,
+        )
+        print(f"bucket: {bucket_stats}")
+
+        _reset_peak_rss()
+
+        started_at = time.perf_counter()
+        response = JobManager().get_tasks_directory_type(
+            "domain-benchmark", options, _SECRET_DATA, start=months[0]
+        )
+        get_tasks_seconds = time.perf_counter() - started_at
+        tasks = response["tasks"]
+
+        result = _run_tasks(options, tasks, trace_allocations=False)
+        result["get_tasks_seconds"] = get_tasks_seconds
+        result["tasks"] = len(tasks)
+        result["peak_rss_mib"] = _get_peak_rss() / 1024
+
+        if args.trace_allocations:
+            # a second pass, tracing allocations slows everything down
+            traced = _run_tasks(options, tasks, trace_allocations=True)
+            result["alloc_bytes_per_row"] = traced["alloc_bytes_per_row"]
+
+    _print_result(result)
+
+
+def _run_tasks(options: dict, tasks: list, trace_allocations: bool) -> dict:
+    rows = 0
+    pages = 0
+    page_peak_bytes = 0
+    first_page_seconds = None
+
+    if trace_allocations:
+        tracemalloc.start()
+
+    started_at = time.perf_counter()
+    for task in tasks:
+        cost_mgr = CostManager()
+        cost_data = cost_mgr.get_data(options, _SECRET_DATA, task["task_options"])
+
+        if trace_allocations:
+            tracemalloc.reset_peak()
+
+        for page in cost_data:
+            if not page["results"]:
+                continue
+
+            if first_page_seconds is None:
+                first_page_seconds = time.perf_counter() - started_at
+
+            rows += len(page["results"])
+            pages += 1
+
+            if trace_allocations:
+                page_peak_bytes += tracemalloc.get_traced_memory()[1]
+                tracemalloc.reset_peak()
+
+    seconds = time.perf_counter() - started_at
+
+    result = {
+        "rows": rows,
+        "pages": pages,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0,
+        "first_page_seconds": first_page_seconds,
+    }
+
+    if trace_allocations:
+        tracemalloc.stop()
+        result["alloc_bytes_per_row"] = page_peak_bytes / rows if rows else 0
+
+    return result
+
+
+def _print_result(result: dict) -> None:
+    print(f"tasks:               {result['tasks']}")
+    print(f"get_tasks:           {result['get_tasks_seconds']:.3f} s")
+    print(f"rows:                {result['rows']} in {result['pages']} pages")
+    print(f"get_data:            {result['seconds']:.3f} s")
+    print(f"rows/s:              {result['rows_per_second']:.0f}")
+    print(f"time to first page:  {result['first_page_seconds'] or 0:.3f} s")
+    print(f"peak RSS:            {result['peak_rss_mib']:.1f} MiB")
+    if "alloc_bytes_per_row" in result:
+        print(f"alloc bytes/row:     {result['alloc_bytes_per_row']:.0f}")
+
+
+def _get_months(count: int) -> list:
+    # the months before the current one, like a backfill of closed months
+    first_month = datetime.utcnow().replace(day=1) - relativedelta(months=count)
+    return [
+        (first_month + relativedelta(months=index)).strftime("%Y-%m")
+        for index in range(count)
+    ]
+
+
+def _reset_peak_rss() -> None:
+    # only on Linux, elsewhere the peak includes generating the bucket
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _get_peak_rss() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _parse_option(value: str) -> tuple:
+    key, value = value.split("=", 1)
+    return key, json.loads(value)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=2)
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=100000, help="rows per object")
+    parser.add_argument("--objects-per-month", type=int, default=1)
+    parser.add_argument("--tag-cardinality", type=int, default=100)
+    parser.add_argument("--tags-per-row", type=int, default=4)
+    parser.add_argument("--service-mix", type=parse_service_mix, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-allocations", action="store_true")
+    parser.add_argument("--option", type=_parse_option, action="append", default=[])
+    args = parser.parse_args()
+    args.options = dict(args.option)
+    return args
+
+
+if __name__ == "__main__":
+    main()
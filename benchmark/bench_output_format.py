@@ -0,0 +1,96 @@
+"""Compare the output formats of Cost.get_data per response page.
+
+Each page goes through the same steps as in the plugin server: the plugin
+builds the page, then CostService validates it with CostsResponse and
+converts it back to a dict for the gRPC message.
+
+    cd src && python ../benchmark/bench_output_format.py --rows 2000 --pages 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import pyarrow as pa
+from spaceone.cost_analysis.plugin.data_source.model import CostsResponse
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from plugin.manager.cost_manager import CostManager
+
+_SERVICE_CODES = ["AmazonEC2", "AmazonS3", "AWSDataTransfer", "AmazonCloudFront"]
+_USAGE_TYPES = ["APN2-BoxUsage:t3.large", "APN2-DataTransfer-Out-Bytes", "US-HTTPS"]
+_REGIONS = ["APN2", "USE1", "EU", ""]
+
+
+def make_batch(rows: int, tag_count: int) -> pa.RecordBatch:
+    tags = [
+        "{"
+        + ", ".join(
+            f'"user:key{k}": "value{random.randint(0, 9)}"' for k in range(tag_count)
+        )
+        + "}"
+        for _ in range(32)
+    ]
+
+    return pa.RecordBatch.from_pydict(
+        {
+            "usage_date": [f"2024-01-{random.randint(1, 28):02d}" for _ in range(rows)],
+            "region": [random.choice(_REGIONS) for _ in range(rows)],
+            "service_code": [random.choice(_SERVICE_CODES) for _ in range(rows)],
+            "usage_type": [random.choice(_USAGE_TYPES) for _ in range(rows)],
+            "instance_type": [random.choice(["t3.large", None]) for _ in range(rows)],
+            "usage_quantity": [random.random() * 100 for _ in range(rows)],
+            "usage_cost": [random.random() * 10 for _ in range(rows)],
+            "tags": [random.choice(tags) for _ in range(rows)],
+        }
+    )
+
+
+def make_page(cost_mgr: CostManager, batch: pa.RecordBatch, output_format: str):
+    page = cost_mgr._make_cost_data(batch, "123456789012", True, output_format)
+    return CostsResponse(**page).dict()
+
+
+def run(batch: pa.RecordBatch, output_format: str, pages: int) -> tuple:
+    cost_mgr = CostManager()
+
+    started_at = time.perf_counter()
+    for _ in range(pages):
+        make_page(cost_mgr, batch, output_format)
+    elapsed = time.perf_counter() - started_at
+
+    # measured in a separate pass, tracing allocations slows everything down
+    tracemalloc.start()
+    peak_sizes = []
+    for _ in range(pages):
+        tracemalloc.reset_peak()
+        make_page(cost_mgr, batch, output_format)
+        peak_sizes.append(tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return elapsed / pages, sum(peak_sizes) / pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--tags", type=int, default=5)
+    args = parser.parse_args()
+
+    batch = make_batch(args.rows, args.tags)
+
+    print(f"{'output_format':<16}{'ms/page':>12}{'peak KiB/page':>16}")
+    for output_format in ["dict", "model"]:
+        seconds, peak_bytes = run(batch, output_format, args.pages)
+        print(f"{output_format:<16}{seconds * 1000:>12.2f}{peak_bytes / 1024:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Synthetic HyperBilling bucket with the layout read by the plugin:
+
+    SPACE_ONE/billing/database={database}/account_id={account_id}/year={year}/month={month}/*.parquet
+"""
+
+import io
+import json
+import random
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+__all__ = ["DEFAULT_SERVICE_MIX", "generate_bucket", "parse_service_mix"]
+
+DEFAULT_SERVICE_MIX = {
+    "AmazonEC2": 0.45,
+    "AmazonS3": 0.15,
+    "AWSDataTransfer": 0.15,
+    "AmazonCloudFront": 0.05,
+    "AmazonRDS": 0.1,
+    "AWSLambda": 0.05,
+    "Credit": 0.05,
+}
+
+_USAGE_TYPES = {
+    "AmazonEC2": ["BoxUsage:t3.large", "BoxUsage:m5.xlarge", "EBS:VolumeUsage.gp3"],
+    "AmazonS3": ["TimedStorage-ByteHrs", "Requests-Tier1", "Requests-Tier2"],
+    "AWSDataTransfer": [
+        "DataTransfer-Out-Bytes",
+        "DataTransfer-In-Bytes",
+        "DataTransfer-Regional-Bytes",
+    ],
+    "AmazonCloudFront": ["US-HTTPS", "US-DataTransfer-Out-Bytes", "US-Requests-Tier1"],
+    "AmazonRDS": ["InstanceUsage:db.r5.large", "RDS:GP2-Storage"],
+    "AWSLambda": ["Lambda-GB-Second", "Request"],
+    "Credit": ["Credit"],
+}
+_INSTANCE_TYPES = ["t3.large", "m5.xlarge", "db.r5.large", ""]
+_REGIONS = ["APN2", "APN1", "USE1", "USW2", "EUC1", "EU", ""]
+_TAG_KEYS = ["Name", "Environment", "Service", "Role", "Application", "Owner"]
+
+
+def parse_service_mix(value: str) -> dict:
+    """"AmazonEC2=0.5,AmazonS3=0.5" -> {"AmazonEC2": 0.5, "AmazonS3": 0.5}"""
+    service_mix = {}
+    for item in value.split(","):
+        service_code, weight = item.split("=")
+        service_mix[service_code.strip()] = float(weight)
+
+    return service_mix
+
+
+def generate_bucket(
+    s3_client,
+    bucket: str,
+    database: str,
+    account_ids: list,
+    months: list,
+    rows_per_object: int,
+    objects_per_month: int = 1,
+    tag_cardinality: int = 100,
+    tags_per_row: int = 4,
+    service_mix: dict = None,
+    row_group_size: int = 64 * 1024,
+    seed: int = 0,
+) -> dict:
+    """Upload the objects of every account and month ("YYYY-MM") and return
+    {"objects": 'int', "rows": 'int', "bytes": 'int'}.
+    """
+    rng = random.Random(seed)
+    service_mix = service_mix or DEFAULT_SERVICE_MIX
+    tags_values = _make_tags_values(rng, tag_cardinality, tags_per_row)
+
+    stats = {"objects": 0, "rows": 0, "bytes": 0}
+    for account_id in account_ids:
+        for month in months:
+            year, month_number = month.split("-")
+            path = (
+                f"SPACE_ONE/billing/database={database}/account_id={account_id}"
+                f"/year={year}/month={month_number}"
+            )
+
+            for index in range(objects_per_month):
+                table = _make_table(rng, month, rows_per_object, service_mix, tags_values)
+                body = io.BytesIO()
+                pq.write_table(table, body, row_group_size=row_group_size)
+
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=f"{path}/part-{index:05d}.parquet",
+                    Body=body.getvalue(),
+                )
+                stats["objects"] += 1
+                stats["rows"] += table.num_rows
+                stats["bytes"] += body.tell()
+
+    return stats
+
+
+def _make_tags_values(rng: random.Random, tag_cardinality: int, tags_per_row: int):
+    tags_values = [None]
+    for index in range(max(tag_cardinality - 1, 0)):
+        keys = rng.sample(_TAG_KEYS, min(tags_per_row, len(_TAG_KEYS)))
+        tags = {f"user:{key}": f"{key.lower()}-{index}" for key in keys}
+        tags_values.append(json.dumps(tags))
+
+    return tags_values
+
+
+def _make_table(
+    rng: random.Random,
+    month: str,
+    rows: int,
+    service_mix: dict,
+    tags_values: list,
+) -> pa.Table:
+    year, month_number = (int(value) for value in month.split("-"))
+    days = [date(year, month_number, day).isoformat() for day in range(1, 29)]
+
+    service_codes = rng.choices(
+        list(service_mix.keys()), weights=list(service_mix.values()), k=rows
+    )
+    regions = rng.choices(_REGIONS, k=rows)
+    usage_types = [
+        f"{region}-{rng.choice(_USAGE_TYPES.get(service_code, ['Usage']))}"
+        for region, service_code in zip(regions, service_codes)
+    ]
+    usage_costs = [
+        -rng.random() * 100 if service_code == "Credit" else rng.random() * 10
+        for service_code in service_codes
+    ]
+
+    return pa.table(
+        {
+            "usage_date": rng.choices(days, k=rows),
+            "region": regions,
+            "service_code": service_codes,
+            "usage_type": usage_types,
+            "usage_unit": rng.choices(["Hrs", "GB", "Requests", ""], k=rows),
+            "instance_type": rng.choices(_INSTANCE_TYPES, k=rows),
+            "usage_quantity": [rng.random() * 1000 for _ in range(rows)],
+            "usage_cost": usage_costs,
+            "tags": rng.choices(tags_values, k=rows),
+        }
+    )
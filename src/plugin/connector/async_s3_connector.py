@@ -0,0 +1,234 @@
+import asyncio
+import logging
+from botocore.exceptions import ClientError
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+except ImportError:
+    get_session = None
+
+from spaceone.core.error import *
+from ..lib import event_loop
+from .aws_s3_connector import AWSS3Connector
+from .s3_range_file import S3RangeFile, _FOOTER_READ_SIZE, _FULL_READ_MAX_SIZE
+
+__all__ = ["AsyncS3Connector"]
+
+_LOGGER = logging.getLogger(__name__)
+
+_DEFAULT_CONCURRENCY = 4
+# a Parquet file ends with the 4-byte length of its metadata and "PAR1"
+_PARQUET_TAIL_SIZE = 8
+
+# aiobotocore session of the shared event loop, it loads the service models once
+_AIO_SESSION = None
+
+
+class AsyncS3Connector(AWSS3Connector):
+    """AWSS3Connector that lists and reads objects with aiobotocore on the shared
+    event loop instead of a thread per request. At most concurrency S3
+    requests of a task are in flight, every request waits for its semaphore.
+
+    The boto3 client of the session is still created. It checks the credential
+    and serves reads outside the ranges that were fetched asynchronously.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = _DEFAULT_CONCURRENCY
+        self.async_client = None
+        self.semaphore = None
+        self._async_client_context = None
+
+    def create_session(
+        self, options: dict, secret_data: dict, schema: str, use_cache: bool = True
+    ):
+        if get_session is None:
+            raise ERROR_INVALID_PARAMETER(
+                key="options.async_engine", reason="aiobotocore is not installed"
+            )
+
+        super().create_session(options, secret_data, schema, use_cache)
+        event_loop.run(self.open_async_client())
+
+    async def open_async_client(self) -> None:
+        # same credential and region as the boto3 client of the session
+        credentials = self.session.get_credentials().get_frozen_credentials()
+        self._async_client_context = _get_aio_session().create_client(
+            "s3",
+            region_name=self.s3_client.meta.region_name,
+            aws_access_key_id=credentials.access_key,
+            aws_secret_access_key=credentials.secret_key,
+            aws_session_token=credentials.token,
+            config=AioConfig(max_pool_connections=max(self.concurrency, 1)),
+        )
+        self.async_client = await self._async_client_context.__aenter__()
+        self.semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+
+    async def close_async_client(self) -> None:
+        if self._async_client_context is None:
+            return
+
+        await self._async_client_context.__aexit__(None, None, None)
+        self._async_client_context = None
+        self.async_client = None
+
+    async def list_objects_async(self, path: str, delimiter: str = None) -> dict:
+        params = {"Bucket": self.s3_bucket, "Prefix": path}
+        if delimiter is not None:
+            params["Delimiter"] = delimiter
+
+        contents = []
+        common_prefixes = []
+
+        paginator = self.async_client.get_paginator("list_objects_v2")
+        async with self.semaphore:
+            with self.metrics.timer("s3_list"):
+                async for response in paginator.paginate(**params):
+                    contents.extend(response.get("Contents", []))
+                    common_prefixes.extend(response.get("CommonPrefixes", []))
+
+        return {"Contents": contents, "CommonPrefixes": common_prefixes}
+
+    async def open_cost_object_async(
+        self,
+        key,
+        size: int = None,
+        columns: list = None,
+        row_filter: pc.Expression = None,
+        etag: str = None,
+        use_object_cache: bool = False,
+    ):
+        """Same as open_cost_object, except that the footer and then every
+        needed column chunk are fetched concurrently before the object is
+        returned, instead of row group by row group while it is read.
+        """
+        if use_object_cache and etag and self.object_cache:
+            file_path = await self._get_cached_object_path_async(key, etag)
+            if file_path is not None:
+                try:
+                    return pa.memory_map(file_path)
+                except FileNotFoundError:
+                    # evicted by another task between get and memory_map
+                    pass
+
+        if size is None:
+            async with self.semaphore:
+                response = await self.async_client.head_object(
+                    Bucket=self.s3_bucket, Key=key
+                )
+            size = response["ContentLength"]
+
+        if size <= _FULL_READ_MAX_SIZE:
+            data = await self._get_range_async(key, 0, size) if size else b""
+            return S3RangeFile(
+                self.s3_client, self.s3_bucket, key, size, self.metrics, [(0, data)]
+            )
+
+        footer_start = max(size - _FOOTER_READ_SIZE, 0)
+        footer = await self._get_range_async(key, footer_start, size - footer_start)
+
+        metadata_size = int.from_bytes(footer[-8:-4], "little") + _PARQUET_TAIL_SIZE
+        if metadata_size > len(footer):
+            footer_start = max(size - metadata_size, 0)
+            footer = await self._get_range_async(key, footer_start, size - footer_start)
+
+        source = S3RangeFile(
+            self.s3_client,
+            self.s3_bucket,
+            key,
+            size,
+            self.metrics,
+            [(footer_start, footer)],
+        )
+
+        try:
+            read_plan = self._make_read_plan(source, columns, row_filter)
+            ranges = S3RangeFile._coalesce_ranges(
+                [column_range for ranges in read_plan for column_range in ranges]
+            )
+            blocks = await asyncio.gather(
+                *(self._get_block_async(key, start, length) for start, length in ranges)
+            )
+            source.add_blocks(blocks)
+        except BaseException:
+            source.close()
+            raise
+
+        return source
+
+    async def get_cost_object_source_async(
+        self, key, etag: str = None, use_object_cache: bool = False
+    ):
+        """Same as get_cost_object_source."""
+        if use_object_cache and etag and self.object_cache:
+            file_path = await self._get_cached_object_path_async(key, etag)
+            if file_path is not None:
+                return file_path
+
+        return await self._get_object_async({"Bucket": self.s3_bucket, "Key": key})
+
+    def _list_paths(self, paths: list, delimiter: str = None) -> list:
+        return event_loop.run(self._list_paths_async(paths, delimiter))
+
+    async def _list_paths_async(self, paths: list, delimiter: str = None) -> list:
+        return await asyncio.gather(
+            *(self.list_objects_async(path, delimiter) for path in paths)
+        )
+
+    async def _get_cached_object_path_async(self, key, etag: str):
+        file_path = self.object_cache.get(self.s3_bucket, key, etag)
+        if file_path is not None:
+            self.metrics.add("object_cache_hits")
+            return file_path
+
+        try:
+            # IfMatch makes sure the cached bytes belong to the listed ETag
+            data = await self._get_object_async(
+                {"Bucket": self.s3_bucket, "Key": key, "IfMatch": etag}
+            )
+        except ClientError as e:
+            _LOGGER.warning(
+                f"[_get_cached_object_path_async] object changed ({key}): {e}"
+            )
+            return None
+
+        # the file is written in the loop's executor, not on the loop
+        return await asyncio.to_thread(
+            self.object_cache.put, self.s3_bucket, key, etag, lambda f: f.write(data)
+        )
+
+    async def _get_block_async(self, key, start: int, length: int) -> tuple:
+        return start, await self._get_range_async(key, start, length)
+
+    async def _get_range_async(self, key, start: int, length: int) -> bytes:
+        return await self._get_object_async(
+            {
+                "Bucket": self.s3_bucket,
+                "Key": key,
+                "Range": f"bytes={start}-{start + length - 1}",
+            }
+        )
+
+    async def _get_object_async(self, params: dict) -> bytes:
+        async with self.semaphore:
+            with self.metrics.timer("s3_download"):
+                response = await self.async_client.get_object(**params)
+                async with response["Body"] as body:
+                    data = await body.read()
+
+        self.metrics.add("s3_bytes", len(data))
+        return data
+
+
+def _get_aio_session():
+    # only called on the event loop, no lock needed
+    global _AIO_SESSION
+
+    if _AIO_SESSION is None:
+        _AIO_SESSION = get_session()
+
+    return _AIO_SESSION
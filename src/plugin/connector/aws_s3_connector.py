@@ -1,18 +1,62 @@
+import hashlib
 import logging
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import boto3
-import io
-import pandas as pd
-import numpy as np
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 
 from spaceone.core import utils
 from spaceone.core.connector import BaseConnector
 from spaceone.core.error import *
+from ..lib.task_metrics import TaskMetrics
+from .object_cache import ObjectCache
+from .s3_range_file import S3RangeFile
 
 __all__ = ['AWSS3Connector']
 
 _LOGGER = logging.getLogger(__name__)
 
-_PAGE_SIZE = 2000
+# rows per decoded batch, response pages are cut from batches by CostManager
+_BATCH_SIZE = 2000
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# billing columns with few distinct values are read without decoding every string
+_DICTIONARY_COLUMNS = [
+    "usage_date",
+    "region",
+    "service_code",
+    "usage_type",
+    "instance_type",
+    "tags",
+]
+_PARQUET_FORMAT = ds.ParquetFileFormat(
+    read_options=ds.ParquetReadOptions(dictionary_columns=_DICTIONARY_COLUMNS),
+    # S3RangeFile fetches and coalesces the column chunks itself
+    default_fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=False),
+)
+# statistics of dictionary columns are not used to skip row groups, row groups
+# are selected with the plain types instead
+_PARQUET_STATS_FORMAT = ds.ParquetFileFormat()
+_LIST_MAX_WORKERS = 8
+_DEFAULT_LIST_CACHE_TTL = 6 * 60 * 60
+
+_S3_MAX_POOL_CONNECTIONS = 32
+_SESSION_CACHE_TTL = 60 * 60
+_SESSION_REFRESH_MARGIN = 5 * 60
+
+# process-wide cache of sessions, {cache_key: (expires_at, session, s3_client)}
+_SESSION_CACHE = {}
+_SESSION_LOCKS = {}
+_SESSION_CACHE_LOCK = threading.Lock()
+
+# process-wide cache of listings, {(bucket, prefix): (expires_at, contents)}
+_LIST_CACHE = {}
+_LIST_CACHE_LOCK = threading.Lock()
 
 
 class AWSS3Connector(BaseConnector):
@@ -22,8 +66,15 @@ class AWSS3Connector(BaseConnector):
         self.session = None
         self.s3_client = None
         self.s3_bucket = None
+        self.object_cache = None
+        self.metrics = TaskMetrics()
 
-    def create_session(self, options: dict, secret_data: dict, schema: str):
+    def create_session(
+        self, options: dict, secret_data: dict, schema: str, use_cache: bool = True
+    ):
+        """Sessions are shared per credential until shortly before they expire.
+        Without use_cache, the credential is always checked with STS.
+        """
         self._check_secret_data(secret_data)
 
         self.s3_bucket = secret_data["aws_s3_bucket"]
@@ -33,43 +84,408 @@ class AWSS3Connector(BaseConnector):
         role_arn = secret_data.get("role_arn")
         external_id = secret_data.get("external_id")
 
-        if role_arn:
-            self._create_session_aws_assume_role(
-                aws_access_key_id,
-                aws_secret_access_key,
-                region_name,
-                role_arn,
-                external_id,
-            )
-        else:
-            self._create_session_aws_access_key(
-                aws_access_key_id, aws_secret_access_key, region_name
+        cache_key = self._make_session_cache_key(
+            aws_access_key_id, aws_secret_access_key, region_name, role_arn, external_id
+        )
+
+        with _SESSION_CACHE_LOCK:
+            session_lock = _SESSION_LOCKS.setdefault(cache_key, threading.Lock())
+
+        # only one thread creates the session of a credential, others wait for it
+        with session_lock:
+            expires_at, session, s3_client = _SESSION_CACHE.get(
+                cache_key, (0, None, None)
             )
+            if use_cache and expires_at > time.time():
+                self.session = session
+                self.s3_client = s3_client
+                return
+
+            with self.metrics.timer("sts"):
+                if role_arn:
+                    expires_at = self._create_session_aws_assume_role(
+                        aws_access_key_id,
+                        aws_secret_access_key,
+                        region_name,
+                        role_arn,
+                        external_id,
+                    )
+                else:
+                    expires_at = self._create_session_aws_access_key(
+                        aws_access_key_id, aws_secret_access_key, region_name
+                    )
 
-        self.s3_client = self.session.client("s3")
+            self.s3_client = self.session.client(
+                "s3", config=Config(max_pool_connections=_S3_MAX_POOL_CONNECTIONS)
+            )
+            self._set_session_cache(
+                cache_key,
+                expires_at - _SESSION_REFRESH_MARGIN,
+                self.session,
+                self.s3_client,
+            )
 
     def list_objects(self, path, delimiter=None):
         params = {"Bucket": self.s3_bucket, "Prefix": path}
         if delimiter is not None:
             params["Delimiter"] = delimiter
 
-        return self.s3_client.list_objects(**params)
+        contents = []
+        common_prefixes = []
+
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        pages = self.metrics.iter_timed(paginator.paginate(**params), "s3_list")
+        for response in pages:
+            contents.extend(response.get("Contents", []))
+            common_prefixes.extend(response.get("CommonPrefixes", []))
+
+        return {"Contents": contents, "CommonPrefixes": common_prefixes}
+
+    def list_common_prefixes(self, path: str, delimiter: str = "/"):
+        """Yield the common prefixes under path page by page, so the caller can
+        start working on the first page before the listing is complete.
+        """
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=self.s3_bucket, Prefix=path, Delimiter=delimiter
+        )
+        for response in pages:
+            for common_prefix in response.get("CommonPrefixes", []):
+                yield common_prefix["Prefix"]
+
+    def has_objects_after(self, path: str, start_after: str) -> bool:
+        # keys are sorted, one key after start_after is enough to know
+        response = self.s3_client.list_objects_v2(
+            Bucket=self.s3_bucket, Prefix=path, StartAfter=start_after, MaxKeys=1
+        )
+        return response.get("KeyCount", 0) > 0
+
+    def list_objects_by_paths(
+        self, paths: list, cacheable_paths: list = None, cache_ttl: int = None
+    ) -> list:
+        """List every path in parallel and return the contents in the same order.
+        Listings of cacheable_paths are kept in a process-wide cache for cache_ttl
+        seconds, so closed months are not listed again on every task.
+        """
+        cacheable_paths = set(cacheable_paths or [])
+        if cache_ttl is None:
+            cache_ttl = _DEFAULT_LIST_CACHE_TTL
+
+        path_contents = {}
+        for path in paths:
+            if path in cacheable_paths:
+                contents = self._get_list_cache((self.s3_bucket, path))
+                if contents is not None:
+                    path_contents[path] = contents
+
+        uncached_paths = [path for path in paths if path not in path_contents]
+        for path, response in zip(uncached_paths, self._list_paths(uncached_paths)):
+            contents = response["Contents"]
+            if path in cacheable_paths and cache_ttl > 0:
+                self._set_list_cache((self.s3_bucket, path), contents, cache_ttl)
+
+            path_contents[path] = contents
+
+        return [path_contents[path] for path in paths]
+
+    def list_months(
+        self,
+        database: str,
+        account_id: str,
+        years: list,
+        cacheable_years: list = None,
+        cache_ttl: int = None,
+    ) -> set:
+        """Return the months ("YYYY-MM") of years that have a partition, with one
+        delimited listing per year instead of one listing per month. Listings
+        of cacheable_years are kept in the process-wide list cache for cache_ttl
+        seconds.
+        """
+        cacheable_years = set(cacheable_years or [])
+        if cache_ttl is None:
+            cache_ttl = _DEFAULT_LIST_CACHE_TTL
+
+        year_months = {}
+        for year in years:
+            if year in cacheable_years:
+                path = self.get_year_path(database, account_id, year)
+                months = self._get_list_cache((self.s3_bucket, path))
+                if months is not None:
+                    year_months[year] = months
+
+        uncached_years = [year for year in years if year not in year_months]
+        paths = [
+            self.get_year_path(database, account_id, year) for year in uncached_years
+        ]
+        for year, path, response in zip(
+            uncached_years, paths, self._list_paths(paths, "/")
+        ):
+            # ".../year=2024/month=01/" -> "2024-01"
+            months = [
+                f"{year}-{common_prefix['Prefix'][len(path):].rstrip('/')}"
+                for common_prefix in response["CommonPrefixes"]
+            ]
+
+            if year in cacheable_years and cache_ttl > 0:
+                self._set_list_cache((self.s3_bucket, path), months, cache_ttl)
+
+            year_months[year] = months
+
+        return {month for months in year_months.values() for month in months}
+
+    def _list_paths(self, paths: list, delimiter: str = None) -> list:
+        if len(paths) <= 1:
+            return [self.list_objects(path, delimiter) for path in paths]
+
+        max_workers = min(len(paths), _LIST_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                executor.map(lambda path: self.list_objects(path, delimiter), paths)
+            )
+
+    @staticmethod
+    def _get_list_cache(cache_key: tuple):
+        with _LIST_CACHE_LOCK:
+            expires_at, contents = _LIST_CACHE.get(cache_key, (0, None))
+
+        if expires_at > time.monotonic():
+            return contents
+
+        return None
+
+    @staticmethod
+    def _set_list_cache(cache_key: tuple, contents: list, cache_ttl: int) -> None:
+        now = time.monotonic()
+        with _LIST_CACHE_LOCK:
+            for key, (expires_at, _) in list(_LIST_CACHE.items()):
+                if expires_at <= now:
+                    del _LIST_CACHE[key]
+
+            _LIST_CACHE[cache_key] = (now + cache_ttl, contents)
+
+    @staticmethod
+    def get_month_path(database: str, account_id: str, month: str) -> str:
+        year, month = month.split("-")
+        return f"SPACE_ONE/billing/database={database}/account_id={account_id}/year={year}/month={month}"
+
+    @staticmethod
+    def get_year_path(database: str, account_id: str, year: str) -> str:
+        # the common prefixes under this path are the month partitions of year
+        return f"SPACE_ONE/billing/database={database}/account_id={account_id}/year={year}/month="
+
+    def init_object_cache(self, cache_dir: str, max_bytes: int) -> None:
+        self.object_cache = ObjectCache(cache_dir, max_bytes)
+
+    def iter_cost_batches(
+        self,
+        key,
+        batch_size=_BATCH_SIZE,
+        source=None,
+        columns: list = None,
+        row_filter: pc.Expression = None,
+        size: int = None,
+        etag: str = None,
+        use_object_cache: bool = False,
+    ):
+        """Read only the given columns and the rows matching row_filter.
+        Row groups whose statistics can not match row_filter are not decoded.
+        """
+        if source is None:
+            source = self.open_cost_object(
+                key, size, columns, row_filter, etag, use_object_cache
+            )
+
+        with source:
+            yield from self.read_cost_batches(source, columns, row_filter, batch_size)
+
+    @classmethod
+    def read_cost_batches(
+        cls,
+        source,
+        columns: list = None,
+        row_filter: pc.Expression = None,
+        batch_size=_BATCH_SIZE,
+    ):
+        """Decode an opened Parquet file, also used in decode worker processes."""
+        fragment = _PARQUET_FORMAT.make_fragment(
+            source, row_groups=cls._get_row_group_ids(source, row_filter)
+        )
+
+        if columns is not None:
+            schema_names = fragment.physical_schema.names
+            columns = [column for column in columns if column in schema_names]
+
+        batches = fragment.to_batches(
+            columns=columns, filter=row_filter, batch_size=batch_size
+        )
+        for batch in batches:
+            if batch.num_rows > 0:
+                yield cls._convert_nan_to_null(batch)
 
-    def get_cost_data(self, key):
-        obj = self.s3_client.get_object(Bucket=self.s3_bucket, Key=key)
-        df = pd.read_parquet(io.BytesIO(obj["Body"].read()))
-        df = df.replace({np.nan: None})
+    def open_cost_object(
+        self,
+        key,
+        size: int = None,
+        columns: list = None,
+        row_filter: pc.Expression = None,
+        etag: str = None,
+        use_object_cache: bool = False,
+    ):
+        """Open an object for iter_cost_batches with ranged GETs. Only the
+        footer and the column chunks of the row groups that can match
+        row_filter are fetched, the first of those row groups right away.
 
-        costs_data = df.to_dict("records")
+        With use_object_cache, the whole object is kept in the local object
+        cache and memory-mapped from there instead.
+        """
+        if use_object_cache and etag and self.object_cache:
+            source = self._open_cached_object(key, etag)
+            if source is not None:
+                return source
 
-        _LOGGER.debug(f"[get_cost_data] costs count({key}): {len(costs_data)}")
+        source = S3RangeFile(self.s3_client, self.s3_bucket, key, size, self.metrics)
+        if source.is_fully_loaded:
+            return source
 
-        # Paginate
-        page_count = int(len(costs_data) / _PAGE_SIZE) + 1
+        source.set_read_plan(self._make_read_plan(source, columns, row_filter))
+        source.prefetch_group(0)
+        return source
+
+    def get_cost_object_source(
+        self, key, etag: str = None, use_object_cache: bool = False
+    ):
+        """Return the local path of a cached object, or else its whole content.
+        Both can be sent to a decode worker process as they are.
+        """
+        if use_object_cache and etag and self.object_cache:
+            file_path = self._get_cached_object_path(key, etag)
+            if file_path is not None:
+                return file_path
+
+        with self.metrics.timer("s3_download"):
+            obj = self.s3_client.get_object(Bucket=self.s3_bucket, Key=key)
+            data = obj["Body"].read()
+
+        self.metrics.add("s3_bytes", len(data))
+        return data
+
+    def _open_cached_object(self, key, etag: str):
+        file_path = self.object_cache.get(self.s3_bucket, key, etag)
+        if file_path is not None:
+            self.metrics.add("object_cache_hits")
+            try:
+                return pa.memory_map(file_path)
+            except FileNotFoundError:
+                # evicted by another task between get and memory_map
+                pass
+
+        file_path = self._download_cached_object(key, etag)
+        if file_path is None:
+            return None
+
+        return pa.memory_map(file_path)
+
+    def _get_cached_object_path(self, key, etag: str):
+        file_path = self.object_cache.get(self.s3_bucket, key, etag)
+        if file_path is not None:
+            self.metrics.add("object_cache_hits")
+            return file_path
+
+        return self._download_cached_object(key, etag)
+
+    def _download_cached_object(self, key, etag: str):
+        def _download(f):
+            # IfMatch makes sure the cached bytes belong to the listed ETag
+            obj = self.s3_client.get_object(
+                Bucket=self.s3_bucket, Key=key, IfMatch=etag
+            )
+            shutil.copyfileobj(obj["Body"], f, _DOWNLOAD_CHUNK_SIZE)
+            self.metrics.add("s3_bytes", f.tell())
 
-        for page_num in range(page_count):
-            offset = _PAGE_SIZE * page_num
-            yield costs_data[offset : offset + _PAGE_SIZE]
+        try:
+            with self.metrics.timer("s3_download"):
+                return self.object_cache.put(self.s3_bucket, key, etag, _download)
+        except ClientError as e:
+            _LOGGER.warning(f"[_download_cached_object] object changed ({key}): {e}")
+            return None
+
+    @classmethod
+    def _make_read_plan(
+        cls, source, columns: list = None, row_filter: pc.Expression = None
+    ) -> list:
+        """Byte ranges of the needed column chunks, one group per row group."""
+        metadata = _PARQUET_STATS_FORMAT.make_fragment(source).metadata
+
+        row_group_ids = cls._get_row_group_ids(source, row_filter)
+        if row_group_ids is None:
+            row_group_ids = range(metadata.num_row_groups)
+
+        read_plan = []
+        for row_group_id in row_group_ids:
+            row_group = metadata.row_group(row_group_id)
+            ranges = []
+            for column_index in range(row_group.num_columns):
+                column = row_group.column(column_index)
+                column_name = column.path_in_schema.split(".")[0]
+                if columns is None or column_name in columns:
+                    ranges.append(cls._get_column_chunk_range(column))
+
+            read_plan.append(ranges)
+
+        return read_plan
+
+    @staticmethod
+    def _get_row_group_ids(source, row_filter: pc.Expression = None):
+        """Row groups whose statistics can match row_filter, None for all."""
+        if row_filter is None:
+            return None
+
+        fragment = _PARQUET_STATS_FORMAT.make_fragment(source)
+        row_groups = fragment.subset(filter=row_filter).row_groups
+        return [row_group.id for row_group in row_groups]
+
+    @staticmethod
+    def _get_column_chunk_range(column) -> tuple:
+        start = column.data_page_offset
+        if column.has_dictionary_page and column.dictionary_page_offset > 0:
+            start = min(start, column.dictionary_page_offset)
+
+        return start, column.total_compressed_size
+
+    @staticmethod
+    def _convert_nan_to_null(batch: pa.RecordBatch) -> pa.RecordBatch:
+        columns = []
+        for column in batch.columns:
+            if pa.types.is_floating(column.type):
+                column = pc.if_else(pc.is_nan(column), None, column)
+            columns.append(column)
+
+        return pa.RecordBatch.from_arrays(columns, schema=batch.schema)
+
+    @staticmethod
+    def _make_session_cache_key(
+        aws_access_key_id, aws_secret_access_key, region_name, role_arn, external_id
+    ) -> tuple:
+        # never keep the secret key itself in the cache key
+        fingerprint = hashlib.sha256(
+            f"{aws_access_key_id}:{aws_secret_access_key}".encode("utf-8")
+        ).hexdigest()
+        return fingerprint, role_arn, external_id, region_name
+
+    @staticmethod
+    def _set_session_cache(cache_key, expires_at, session, s3_client) -> None:
+        now = time.time()
+        with _SESSION_CACHE_LOCK:
+            for key, (cached_expires_at, _, _) in list(_SESSION_CACHE.items()):
+                if cached_expires_at <= now:
+                    del _SESSION_CACHE[key]
+
+            _SESSION_CACHE[cache_key] = (expires_at, session, s3_client)
+
+            # locks of expired or failed credentials, a lock in use is kept
+            for key, session_lock in list(_SESSION_LOCKS.items()):
+                if key not in _SESSION_CACHE and not session_lock.locked():
+                    del _SESSION_LOCKS[key]
 
     @staticmethod
     def _check_secret_data(secret_data):
@@ -94,6 +510,8 @@ class AWSS3Connector(BaseConnector):
         sts = self.session.client("sts")
         sts.get_caller_identity()
 
+        return time.time() + _SESSION_CACHE_TTL
+
     def _create_session_aws_assume_role(
         self,
         aws_access_key_id,
@@ -125,3 +543,5 @@ class AWSS3Connector(BaseConnector):
             region_name=region_name,
             aws_session_token=credentials["SessionToken"],
         )
+
+        return credentials["Expiration"].timestamp()
@@ -0,0 +1,79 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+__all__ = ["ObjectCache"]
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ObjectCache:
+    """Size-bounded local disk cache of S3 objects, keyed by bucket, key and ETag.
+
+    A changed object gets a new ETag and therefore a new cache entry, old
+    entries are evicted in least recently used order once the cache grows
+    over max_bytes.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, bucket: str, key: str, etag: str):
+        file_path = self._make_file_path(bucket, key, etag)
+
+        try:
+            # mtime is used as the last access time for eviction
+            os.utime(file_path)
+            return file_path
+        except FileNotFoundError:
+            return None
+
+    def put(self, bucket: str, key: str, etag: str, download_func) -> str:
+        """download_func(f) writes the object into the binary file f"""
+        file_path = self._make_file_path(bucket, key, etag)
+
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                download_func(f)
+            os.replace(temp_path, file_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        self._evict(keep_path=file_path)
+        return file_path
+
+    def _evict(self, keep_path: str) -> None:
+        with self._lock:
+            entries = []
+            total_size = 0
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith(".parquet"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+
+            # files that are still memory-mapped stay readable after unlink
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_bytes:
+                    break
+
+                if path == keep_path:
+                    continue
+
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except FileNotFoundError:
+                    pass
+
+    def _make_file_path(self, bucket: str, key: str, etag: str) -> str:
+        file_name = hashlib.sha256(f"{bucket}/{key}/{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{file_name}.parquet")
@@ -0,0 +1,232 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..lib.task_metrics import TaskMetrics
+
+__all__ = ["S3RangeFile"]
+
+_LOGGER = logging.getLogger(__name__)
+
+_FULL_READ_MAX_SIZE = 8 * 1024 * 1024
+_FOOTER_READ_SIZE = 64 * 1024
+_COALESCE_GAP_SIZE = 512 * 1024
+_MAX_RANGE_SIZE = 32 * 1024 * 1024
+_MAX_WORKERS = 8
+
+
+class S3RangeFile(io.RawIOBase):
+    """Read-only, seekable file object over an S3 object using ranged GETs.
+
+    Small objects are fetched with a single GET. For larger ones only the
+    footer is fetched on open. Byte ranges that will be read can be registered
+    in groups (e.g. the column chunks of one row group) with set_read_plan().
+    When a read hits a group, the ranges of that group are coalesced and
+    fetched in parallel, the next group is fetched ahead in the background
+    and the groups before it are released.
+
+    blocks, [(start, data), ...] that were already fetched (e.g. by an async
+    client), are read from instead and nothing is fetched on open.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        key: str,
+        size: int = None,
+        metrics=None,
+        blocks: list = None,
+    ):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.metrics = metrics or TaskMetrics()
+
+        if size is None:
+            size = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+        self.size = size
+        self._position = 0
+        self._blocks = []
+        self._groups = []
+        self._group_futures = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS)
+
+        if blocks is not None:
+            self._blocks.extend(blocks)
+        elif size == 0:
+            self._blocks.append((0, b""))
+        elif size <= _FULL_READ_MAX_SIZE:
+            self._blocks.append((0, self._get_range(0, size)))
+        else:
+            footer_start = max(size - _FOOTER_READ_SIZE, 0)
+            self._blocks.append(
+                (footer_start, self._get_range(footer_start, size - footer_start))
+            )
+
+    @property
+    def is_fully_loaded(self) -> bool:
+        return self.size <= _FULL_READ_MAX_SIZE
+
+    def add_blocks(self, blocks: list) -> None:
+        with self._lock:
+            self._blocks.extend(blocks)
+
+    def set_read_plan(self, groups: list) -> None:
+        """groups: [[(start, length), ...], ...] in the order they will be read"""
+        if self.is_fully_loaded:
+            return
+
+        with self._lock:
+            self._groups = [self._coalesce_ranges(ranges) for ranges in groups]
+            self._group_futures = {}
+
+    def prefetch_group(self, group_index: int) -> None:
+        with self._lock:
+            self._submit_group(group_index)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._position
+
+        data = self._read_range(self._position, size)
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._blocks = []
+            self._group_futures = {}
+
+        super().close()
+
+    def _read_range(self, offset: int, length: int) -> bytes:
+        length = min(length, self.size - offset)
+        if length <= 0:
+            return b""
+
+        # also when the group was read ahead already, so that the next group is
+        # read ahead and the ones before are released
+        group_index = self._find_group(offset)
+        if group_index is not None:
+            self._load_group(group_index)
+
+        data = self._find_block(offset, length)
+        if data is not None:
+            return data
+
+        # not planned or the reader asked for more than planned
+        return self._get_range(offset, length)
+
+    def _find_block(self, offset: int, length: int):
+        with self._lock:
+            blocks = list(self._blocks)
+            for futures in self._group_futures.values():
+                blocks.extend(future.result() for future in futures if future.done())
+
+        for start, data in blocks:
+            if start <= offset and offset + length <= start + len(data):
+                return data[offset - start : offset - start + length]
+
+        return None
+
+    def _find_group(self, offset: int):
+        for group_index, ranges in enumerate(self._groups):
+            for start, length in ranges:
+                if start <= offset < start + length:
+                    return group_index
+
+        return None
+
+    def _load_group(self, group_index: int) -> None:
+        with self._lock:
+            futures = self._submit_group(group_index)
+
+            # groups are read in order, release the ones before this group
+            for index in list(self._group_futures.keys()):
+                if index < group_index:
+                    del self._group_futures[index]
+
+            # read the next group ahead while this one is decoded
+            self._submit_group(group_index + 1)
+
+        for future in futures:
+            future.result()
+
+    def _submit_group(self, group_index: int) -> list:
+        if group_index >= len(self._groups):
+            return []
+
+        if group_index not in self._group_futures:
+            self._group_futures[group_index] = [
+                self._executor.submit(self._get_block, start, length)
+                for start, length in self._groups[group_index]
+            ]
+
+        return self._group_futures[group_index]
+
+    def _get_block(self, start: int, length: int) -> tuple:
+        return start, self._get_range(start, length)
+
+    def _get_range(self, start: int, length: int) -> bytes:
+        with self.metrics.timer("s3_download"):
+            response = self.s3_client.get_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Range=f"bytes={start}-{start + length - 1}",
+            )
+            data = response["Body"].read()
+
+        self.metrics.add("s3_bytes", len(data))
+        return data
+
+    @staticmethod
+    def _coalesce_ranges(ranges: list) -> list:
+        coalesced = []
+        for start, length in sorted(ranges):
+            if coalesced:
+                last_start, last_length = coalesced[-1]
+                last_end = last_start + last_length
+                end = max(last_end, start + length)
+
+                if (
+                    start - last_end <= _COALESCE_GAP_SIZE
+                    and end - last_start <= _MAX_RANGE_SIZE
+                ):
+                    coalesced[-1] = (last_start, end - last_start)
+                    continue
+
+            coalesced.append((start, length))
+
+        return coalesced
@@ -1,16 +1,40 @@
+import asyncio
 import logging
 import re
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from google.protobuf.json_format import MessageToDict
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
 from spaceone.core.connector.space_connector import SpaceConnector
 from spaceone.core.connector import BaseConnector
 from spaceone.core.error import *
+from ..lib.task_metrics import TaskMetrics
 
 __all__ = ["SpaceONEConnector"]
 
 _LOGGER = logging.getLogger(__name__)
 
+_DEFAULT_CONNECT_TIMEOUT = 5
+_DEFAULT_READ_TIMEOUT = 60
+_DEFAULT_MAX_RETRIES = 3
+_DEFAULT_RETRY_BACKOFF = 0.5
+_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+_HTTP_POOL_MAXSIZE = 32
+
+# process-wide HTTP sessions, {(endpoint, max_retries, retry_backoff): Session}
+_HTTP_SESSIONS = {}
+_HTTP_SESSIONS_LOCK = threading.Lock()
+
+# aiohttp sessions of the shared event loop, {endpoint: ClientSession}
+_AIOHTTP_SESSIONS = {}
+
 
 class SpaceONEConnector(BaseConnector):
 
@@ -20,6 +44,11 @@ class SpaceONEConnector(BaseConnector):
         self.token = None
         self.protocol = None
         self.endpoint = None
+        self.http_session = None
+        self.timeout = None
+        self.max_retries = _DEFAULT_MAX_RETRIES
+        self.retry_backoff = _DEFAULT_RETRY_BACKOFF
+        self.metrics = TaskMetrics()
 
     def init_client(self, options: dict, secret_data: dict, schema: str = None) -> None:
         task_type = options.get("task_type", "identity")
@@ -32,6 +61,17 @@ class SpaceONEConnector(BaseConnector):
         ):
             self.protocol = "http"
             self.endpoint = spaceone_endpoint
+            self.max_retries = options.get("spaceone_max_retries", _DEFAULT_MAX_RETRIES)
+            self.retry_backoff = options.get(
+                "spaceone_retry_backoff", _DEFAULT_RETRY_BACKOFF
+            )
+            self.http_session = self._get_http_session(
+                spaceone_endpoint, self.max_retries, self.retry_backoff
+            )
+            self.timeout = (
+                options.get("spaceone_connect_timeout", _DEFAULT_CONNECT_TIMEOUT),
+                options.get("spaceone_read_timeout", _DEFAULT_READ_TIMEOUT),
+            )
         elif spaceone_endpoint.startswith("grpc") or spaceone_endpoint.startswith(
             "grpc+ssl"
         ):
@@ -47,11 +87,14 @@ class SpaceONEConnector(BaseConnector):
         }
         self.dispatch(method, params)
 
-    def list_projects(self, domain_id: str):
+    def list_projects(self, domain_id: str, page: dict = None):
         params = {
             "query": {"filter": [{"k": "tags.domain_id", "v": domain_id, "o": "eq"}]}
         }
 
+        if page:
+            params["query"]["page"] = page
+
         return self.dispatch("Project.list", params)
 
     def get_service_account(self, service_account_id):
@@ -64,26 +107,85 @@ class SpaceONEConnector(BaseConnector):
 
         return self.dispatch("ServiceAccount.update", params)
 
-    def list_service_accounts(self, project_id: str):
+    async def get_service_account_async(self, service_account_id):
+        params = {"service_account_id": service_account_id}
+
+        return await self.dispatch_async("ServiceAccount.get", params)
+
+    async def update_service_account_async(self, service_account_id, tags):
+        params = {"service_account_id": service_account_id, "tags": tags}
+
+        return await self.dispatch_async("ServiceAccount.update", params)
+
+    def list_service_accounts(self, project_id: str, page: dict = None):
         params = {"provider": "aws", "project_id": project_id}
 
+        if page:
+            params["query"] = {"page": page}
+
         return self.dispatch("ServiceAccount.list", params)
 
     def _get_metadata(self):
         return (("token", self.token),)
 
     def dispatch(self, method: str = None, params: dict = None, **kwargs):
-        if self.protocol == "grpc":
-            return self.grpc_client.dispatch(method, params, **kwargs)
-        else:
-            return self.request(method, params, **kwargs)
+        with self.metrics.timer("spaceone"):
+            if self.protocol == "grpc":
+                return self.grpc_client.dispatch(method, params, **kwargs)
+            else:
+                return self.request(method, params, **kwargs)
+
+    async def dispatch_async(self, method: str = None, params: dict = None, **kwargs):
+        """dispatch on the shared event loop. SpaceConnector only has a blocking
+        gRPC client, so gRPC endpoints are called in the executor of the loop.
+        """
+        with self.metrics.timer("spaceone"):
+            if self.protocol == "grpc":
+                return await asyncio.to_thread(
+                    self.grpc_client.dispatch, method, params, **kwargs
+                )
+            else:
+                return await self.request_async(method, params, **kwargs)
+
+    async def request_async(self, method, params, **kwargs):
+        method = self._convert_method_to_snake_case(method)
+        url = f"{self.endpoint}/{method}"
+
+        headers = self._make_request_header(self.token, **kwargs)
+        session = self._get_aiohttp_session(self.endpoint)
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.timeout[0], sock_read=self.timeout[1]
+        )
+
+        # same retries as the HTTPAdapter of request
+        for retry in range(self.max_retries + 1):
+            is_last_try = retry == self.max_retries
+            try:
+                async with session.post(
+                    url, json=params, headers=headers, timeout=timeout
+                ) as response:
+                    if is_last_try or response.status not in _RETRY_STATUS_CODES:
+                        body = await response.json(content_type=None)
+                        if response.status >= 400:
+                            raise requests.HTTPError(
+                                f'HTTP {response.status} Error: {body["detail"]}'
+                            )
+
+                        return body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if is_last_try:
+                    raise
+
+            await asyncio.sleep(self.retry_backoff * (2**retry))
 
     def request(self, method, params, **kwargs):
         method = self._convert_method_to_snake_case(method)
         url = f"{self.endpoint}/{method}"
 
         headers = self._make_request_header(self.token, **kwargs)
-        response = requests.post(url, json=params, headers=headers)
+        response = self.http_session.post(
+            url, json=params, headers=headers, timeout=self.timeout
+        )
 
         if response.status_code >= 400:
             raise requests.HTTPError(
@@ -93,6 +195,44 @@ class SpaceONEConnector(BaseConnector):
         response = response.json()
         return response
 
+    @staticmethod
+    def _get_http_session(
+        endpoint: str, max_retries: int, retry_backoff: float
+    ) -> requests.Session:
+        session_key = (endpoint, max_retries, retry_backoff)
+
+        with _HTTP_SESSIONS_LOCK:
+            if session_key not in _HTTP_SESSIONS:
+                # all SpaceONE APIs are called with POST, so POST has to be retried too
+                retry = Retry(
+                    total=max_retries,
+                    backoff_factor=retry_backoff,
+                    status_forcelist=_RETRY_STATUS_CODES,
+                    allowed_methods=["POST"],
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=_HTTP_POOL_MAXSIZE,
+                    max_retries=retry,
+                )
+
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _HTTP_SESSIONS[session_key] = session
+
+            return _HTTP_SESSIONS[session_key]
+
+    @staticmethod
+    def _get_aiohttp_session(endpoint: str):
+        # only called on the event loop, no lock needed
+        if endpoint not in _AIOHTTP_SESSIONS:
+            connector = aiohttp.TCPConnector(limit_per_host=_HTTP_POOL_MAXSIZE)
+            _AIOHTTP_SESSIONS[endpoint] = aiohttp.ClientSession(connector=connector)
+
+        return _AIOHTTP_SESSIONS[endpoint]
+
     @staticmethod
     def _convert_method_to_snake_case(method):
         method = re.sub(r"(?<!^)(?=[A-Z])", "_", method)
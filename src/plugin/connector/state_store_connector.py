@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from spaceone.core import cache
+from spaceone.core.connector import BaseConnector
+from spaceone.core.error import *
+
+__all__ = ["StateStoreConnector"]
+
+_LOGGER = logging.getLogger(__name__)
+
+_DEFAULT_BACKEND = "file"
+_DEFAULT_STATE_DIR = os.path.join(tempfile.gettempdir(), "aws-hyperbilling-state")
+_CACHE_KEY_PREFIX = "aws-hyperbilling"
+
+
+class StateStoreConnector(BaseConnector):
+    """Small key-value store for plugin state that has to survive between tasks.
+
+    backends:
+        file: one JSON file per key under options.state_store_path
+        cache: spaceone.core.cache (e.g. Redis configured in CACHES)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.backend = None
+        self.state_dir = None
+
+    def init_store(self, options: dict) -> None:
+        self.backend = options.get("state_store_backend", _DEFAULT_BACKEND)
+
+        if self.backend == "file":
+            self.state_dir = options.get("state_store_path", _DEFAULT_STATE_DIR)
+        elif self.backend == "cache":
+            if not cache.is_set():
+                raise ERROR_INVALID_PARAMETER(
+                    key="options.state_store_backend",
+                    reason="cache is not configured",
+                )
+        else:
+            raise ERROR_INVALID_PARAMETER(
+                key="options.state_store_backend",
+                reason="state_store_backend should be 'file' or 'cache'",
+            )
+
+    def get(self, namespace: str, key: str):
+        if self.backend == "cache":
+            return cache.get(self._make_cache_key(namespace, key))
+
+        file_path = self._make_file_path(namespace, key)
+        try:
+            with open(file_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _LOGGER.warning(f"[get] failed to read state ({file_path}): {e}")
+            return None
+
+    def set(self, namespace: str, key: str, value) -> None:
+        if self.backend == "cache":
+            cache.set(self._make_cache_key(namespace, key), value)
+            return
+
+        file_path = self._make_file_path(namespace, key)
+        dir_path = os.path.dirname(file_path)
+        os.makedirs(dir_path, exist_ok=True)
+
+        # write to a temp file first so that readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=dir_path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+            os.replace(temp_path, file_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def delete(self, namespace: str, key: str) -> None:
+        if self.backend == "cache":
+            cache.delete(self._make_cache_key(namespace, key))
+            return
+
+        try:
+            os.remove(self._make_file_path(namespace, key))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _make_cache_key(namespace: str, key: str) -> str:
+        return f"{_CACHE_KEY_PREFIX}:{namespace}:{key}"
+
+    def _make_file_path(self, namespace: str, key: str) -> str:
+        file_name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.state_dir, namespace, f"{file_name}.json")
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Coroutine
+
+__all__ = ["get_event_loop", "submit", "run"]
+
+# blocking work that has no async client, e.g. gRPC dispatch and disk writes
+_EXECUTOR_MAX_WORKERS = 8
+
+# process-wide event loop shared by every Cost.get_data stream
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """The event loop runs forever in a daemon thread, created on first use."""
+    global _LOOP
+
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(
+                ThreadPoolExecutor(
+                    max_workers=_EXECUTOR_MAX_WORKERS, thread_name_prefix="event-loop"
+                )
+            )
+            threading.Thread(
+                target=loop.run_forever, name="event-loop", daemon=True
+            ).start()
+            _LOOP = loop
+
+    return _LOOP
+
+
+def submit(coro: Coroutine) -> Future:
+    """Schedule coro on the shared loop from any other thread."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def run(coro: Coroutine):
+    """Run coro on the shared loop and wait for its result, never call this
+    from the loop itself.
+    """
+    return submit(coro).result()
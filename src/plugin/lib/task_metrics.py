@@ -0,0 +1,226 @@
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Generator, Iterable
+
+__all__ = ["TaskMetrics", "register_exporter"]
+
+_LOGGER = logging.getLogger(__name__)
+_PROFILE_TOP_LINES = 30
+
+# process-wide exporters, each is called with the summary of every task
+_EXPORTERS = {}
+_EXPORTERS_LOCK = threading.Lock()
+
+
+class TaskMetrics:
+    """Per-stage timers and byte and row counters of one Cost.get_data task.
+
+    Stages are timed in wall-clock seconds and may overlap, e.g. s3_download of
+    prefetched objects runs while the previous object is decoded. The
+    connectors of a task share its metrics through their metrics attribute and
+    record into it from any thread.
+
+    summary: {
+        'task': 'dict',         # account_id, database, start and end of the task
+        'elapsed': 'float',
+        'stages': 'dict',       # {stage: {'seconds': 'float', 'calls': 'int'}}
+        'counters': 'dict',     # {counter: 'int'}
+        'profile': 'str'        # only with profile_task
+    }
+    """
+
+    def __init__(self, task: dict = None, profile: str = None):
+        self.task = task or {}
+        self.profile = profile
+        self.started_at = time.monotonic()
+        self.stages = defaultdict(lambda: [0.0, 0])
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._profile_result = None
+
+    @contextmanager
+    def timer(self, stage: str):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.monotonic() - started_at)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            timer = self.stages[stage]
+            timer[0] += seconds
+            timer[1] += 1
+
+    def add(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] += value
+
+    def iter_timed(self, iterable: Iterable, stage: str) -> Generator:
+        """Time how long every item of iterable takes to be produced."""
+        iterator = iter(iterable)
+        while True:
+            started_at = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(stage, time.monotonic() - started_at)
+
+            yield item
+
+    def time_consumer(self, generator: Generator, stage: str) -> Generator:
+        """Yield from generator and time how long the consumer holds each item.
+        Returns the return value of generator.
+        """
+        try:
+            while True:
+                try:
+                    item = next(generator)
+                except StopIteration as e:
+                    return e.value
+
+                started_at = time.monotonic()
+                yield item
+                self.add_time(stage, time.monotonic() - started_at)
+        finally:
+            generator.close()
+
+    def start_profile(self) -> None:
+        if self.profile == "cprofile":
+            # profiles the thread that consumes the task, like the gRPC worker
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == "tracemalloc":
+            if tracemalloc.is_tracing():
+                _LOGGER.warning("[start_profile] tracemalloc is used by another task")
+                self.profile = None
+            else:
+                tracemalloc.start()
+
+    def stop_profile(self) -> None:
+        if self.profile == "cprofile" and self._profiler:
+            self._profiler.disable()
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(_PROFILE_TOP_LINES)
+            self._profile_result = stream.getvalue()
+            self._profiler = None
+        elif self.profile == "tracemalloc" and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            top_stats = snapshot.statistics("lineno")[:_PROFILE_TOP_LINES]
+            self._profile_result = "\n".join(str(stat) for stat in top_stats)
+
+    def summary(self) -> dict:
+        with self._lock:
+            summary = {
+                "task": self.task,
+                "elapsed": round(time.monotonic() - self.started_at, 3),
+                "stages": {
+                    stage: {"seconds": round(seconds, 3), "calls": calls}
+                    for stage, (seconds, calls) in self.stages.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+        if self._profile_result:
+            summary["profile"] = self._profile_result
+
+        return summary
+
+    def export(self, exporters: list = None) -> dict:
+        summary = self.summary()
+        _LOGGER.info(f"[export] task metrics: {summary}")
+
+        for name in exporters or []:
+            exporter = _EXPORTERS.get(name)
+            if exporter is None:
+                _LOGGER.warning(f"[export] unknown metrics exporter: {name}")
+                continue
+
+            try:
+                exporter(summary)
+            except Exception as e:
+                _LOGGER.warning(f"[export] metrics exporter failed ({name}): {e}")
+
+        return summary
+
+
+def register_exporter(name: str, exporter: Callable[[dict], None]) -> None:
+    """Register a function that is called with the summary of every task
+    whose metrics_exporters option includes name.
+    """
+    with _EXPORTERS_LOCK:
+        _EXPORTERS[name] = exporter
+
+
+def _make_prometheus_exporter():
+    try:
+        from prometheus_client import Counter
+    except ImportError:
+        return None
+
+    stage_seconds = Counter(
+        "hyperbilling_task_stage_seconds",
+        "Seconds spent per stage of Cost.get_data tasks",
+        ["stage"],
+    )
+    stage_calls = Counter(
+        "hyperbilling_task_stage_calls",
+        "Calls per stage of Cost.get_data tasks",
+        ["stage"],
+    )
+    counters = Counter(
+        "hyperbilling_task_counter",
+        "Bytes, rows and objects processed by Cost.get_data tasks",
+        ["counter"],
+    )
+
+    def _export(summary: dict) -> None:
+        for stage, timer in summary["stages"].items():
+            stage_seconds.labels(stage=stage).inc(timer["seconds"])
+            stage_calls.labels(stage=stage).inc(timer["calls"])
+
+        for counter, value in summary["counters"].items():
+            counters.labels(counter=counter).inc(value)
+
+    return _export
+
+
+def _make_opentelemetry_exporter():
+    try:
+        from opentelemetry import metrics
+    except ImportError:
+        return None
+
+    meter = metrics.get_meter(__name__)
+    stage_seconds = meter.create_counter("hyperbilling.task.stage.seconds", unit="s")
+    counters = meter.create_counter("hyperbilling.task.counter")
+
+    def _export(summary: dict) -> None:
+        for stage, timer in summary["stages"].items():
+            stage_seconds.add(timer["seconds"], {"stage": stage})
+
+        for counter, value in summary["counters"].items():
+            counters.add(value, {"counter": counter})
+
+    return _export
+
+
+for _name, _make_exporter in [
+    ("prometheus", _make_prometheus_exporter),
+    ("opentelemetry", _make_opentelemetry_exporter),
+]:
+    _exporter = _make_exporter()
+    if _exporter:
+        register_exporter(_name, _exporter)
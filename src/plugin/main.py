@@ -3,6 +3,7 @@ from spaceone.cost_analysis.plugin.data_source.lib.server import DataSourcePlugi
 from .manager.data_source_manager import DataSourceManager
 from .manager.job_manager import JobManager
 from .manager.cost_manager import CostManager
+from .manager.async_cost_manager import AsyncCostManager
 
 app = DataSourcePluginServer()
 
@@ -132,5 +133,9 @@ def cost_get_data(params: dict) -> Generator[dict, None, None]:
     task_options = params.get("task_options", {})
     schema = params.get("schema")
 
-    cost_mgr = CostManager()
+    if options.get("async_engine", False):
+        cost_mgr = AsyncCostManager()
+    else:
+        cost_mgr = CostManager()
+
     return cost_mgr.get_data(options, secret_data, task_options, schema)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Generator, Iterable
+
+import pyarrow as pa
+
+from ..connector.async_s3_connector import AsyncS3Connector
+from ..lib import event_loop
+from .cost_manager import (
+    CostManager,
+    _COST_DATA_COLUMNS,
+    _decode_cost_object,
+    _prefetch_in_order,
+)
+
+_LOGGER = logging.getLogger(__name__)
+_DEFAULT_ASYNC_CONCURRENCY = 4
+
+
+class AsyncCostManager(CostManager):
+    """Cost.get_data engine that lists and reads S3 with aiobotocore and calls
+    SpaceONE with aiohttp, as coroutines on one process-wide event loop instead
+    of a thread per request.
+
+    Every stream has its own S3 client and semaphore, at most async_concurrency
+    S3 requests of a stream are in flight. Objects are still yielded in listing
+    order through the generator of CostManager.get_data.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aws_s3_connector = AsyncS3Connector()
+        self._sync_state_futures = []
+
+    def get_data(
+        self, options: dict, secret_data: dict, task_options: dict, schema: str = None
+    ) -> Generator[dict, None, None]:
+        self.aws_s3_connector.concurrency = max(
+            options.get("async_concurrency", _DEFAULT_ASYNC_CONCURRENCY), 1
+        )
+
+        try:
+            yield from super().get_data(options, secret_data, task_options, schema)
+        finally:
+            event_loop.run(self.aws_s3_connector.close_async_client())
+
+    def _get_task_data(
+        self, options: dict, secret_data: dict, task_options: dict, schema: str = None
+    ) -> Generator[dict, None, dict]:
+        month_contents = yield from super()._get_task_data(
+            options, secret_data, task_options, schema
+        )
+
+        # the task only succeeds if its service account was updated
+        while self._sync_state_futures:
+            self._sync_state_futures.pop().result()
+
+        return month_contents
+
+    def _update_sync_state(self, options, secret_data, schema, service_account_id):
+        # dispatched now, the objects are listed and opened in the meantime
+        self.space_connector.init_client(options, secret_data, schema)
+        self._sync_state_futures.append(
+            event_loop.submit(self._update_sync_state_async(service_account_id))
+        )
+
+    async def _update_sync_state_async(self, service_account_id):
+        service_account_info = await self.space_connector.get_service_account_async(
+            service_account_id
+        )
+        tags = service_account_info.get("tags", {})
+        tags["is_sync"] = "true"
+        await self.space_connector.update_service_account_async(
+            service_account_id, tags
+        )
+
+    def _make_object_opener(self, row_filter, cached_keys: set) -> Callable:
+        async def _open_object(content):
+            return await self.aws_s3_connector.open_cost_object_async(
+                content["Key"],
+                content.get("Size"),
+                _COST_DATA_COLUMNS,
+                row_filter,
+                content.get("ETag"),
+                content["Key"] in cached_keys,
+            )
+
+        return _open_object
+
+    def _make_object_decoder(
+        self,
+        row_filter,
+        include_credit: bool,
+        group_columns: list,
+        cached_keys: set,
+        decode_pool: ProcessPoolExecutor,
+    ) -> Callable:
+        decode_args = (_COST_DATA_COLUMNS, row_filter, include_credit, group_columns)
+
+        async def _decode_object(content):
+            key = content["Key"]
+            source = await self.aws_s3_connector.get_cost_object_source_async(
+                key, content.get("ETag"), key in cached_keys
+            )
+
+            try:
+                with self.metrics.timer("parquet_decode"):
+                    pages = decode_pool.submit(_decode_cost_object, source, *decode_args)
+                    return pa.BufferReader(await asyncio.wrap_future(pages))
+            except FileNotFoundError:
+                # evicted from the object cache before the worker opened it
+                source = await self.aws_s3_connector.get_cost_object_source_async(key)
+                with self.metrics.timer("parquet_decode"):
+                    pages = decode_pool.submit(_decode_cost_object, source, *decode_args)
+                    return pa.BufferReader(await asyncio.wrap_future(pages))
+
+        return _decode_object
+
+    def _prefetch_objects(
+        self,
+        contents: Iterable[dict],
+        open_object: Callable,
+        prefetch_size: int,
+        prefetch_max_bytes: int,
+        get_result_size: Callable = None,
+    ) -> Generator[tuple, None, None]:
+        # open_object is a coroutine function, the semaphore of the connector
+        # bounds the requests, prefetch_size the objects held in memory
+        yield from _prefetch_in_order(
+            contents,
+            lambda content: event_loop.submit(open_object(content)),
+            max(prefetch_size, 1),
+            prefetch_max_bytes,
+            get_result_size,
+        )
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Union
+
+from spaceone.core.manager import BaseManager
+from ..connector.state_store_connector import StateStoreConnector
+
+_LOGGER = logging.getLogger(__name__)
+_NAMESPACE = "checkpoint"
+
+
+class CheckpointManager(BaseManager):
+    """Progress of a Cost.get_data task, so that a retried task resumes after
+    the last page the server received instead of from its first month.
+
+    Pages are cut from the objects of each sub task in listing order. The
+    generator resuming after a page only means gRPC queued it, not that the
+    server received it, so a page is written as received once the generator
+    resumes after the page that follows it. A retry may send the last page
+    before the failure again.
+
+    The task options carry the run_id of their job, so only a retry of a task
+    of the same job finds its checkpoint. It is still only trusted if every sub
+    task lists the same objects (keys and ETags) as when it was saved.
+    Otherwise the task starts over from the first sub task that differs.
+
+    checkpoint: {
+        'listings': 'list',     # listing hash of every sub task up to the one in progress
+        'sent_keys': 'list',    # s3 keys of the sub task in progress that were fully received
+        'key': 'str',           # s3 key of the object in progress, None if there is none
+        'rows': 'int',          # rows of key received
+        'updated_at': 'float'
+    }
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state_store_connector = StateStoreConnector()
+        self.checkpoint_key = None
+        self.checkpoint = None
+        self.sub_task = 0
+        self.listings = []
+        self.sent_keys = set()
+        self.pending_checkpoint = None
+
+    def init_checkpoint(self, options: dict, bucket: str, task_options: dict) -> None:
+        self.state_store_connector.init_store(options)
+
+        # row offsets are of aggregated rows if the task aggregates
+        task = json.dumps(
+            [task_options, options.get("aggregate_keys")], sort_keys=True, default=str
+        )
+        task_hash = hashlib.sha256(task.encode("utf-8")).hexdigest()
+        self.checkpoint_key = f"{bucket}/{task_hash}"
+        self.checkpoint = self.state_store_connector.get(
+            _NAMESPACE, self.checkpoint_key
+        )
+
+        if self.checkpoint:
+            _LOGGER.info(f"[init_checkpoint] resume task: {self.checkpoint}")
+
+    def start_sub_task(self, sub_task: int) -> None:
+        self.sub_task = sub_task
+        self.sent_keys = set()
+
+    def get_remaining_contents(self, contents: list) -> tuple:
+        """Returns the contents that are not received yet and the number of rows
+        to skip in the first of them.
+        """
+        if self.checkpoint_key is None:
+            return contents, 0
+
+        listing = self._make_listing_hash(contents)
+        self.listings = self.listings[: self.sub_task] + [listing]
+
+        if not self.checkpoint:
+            return contents, 0
+
+        listings = self.checkpoint["listings"]
+        if self.sub_task >= len(listings):
+            return contents, 0
+
+        if listings[self.sub_task] != listing:
+            _LOGGER.warning(
+                f"[get_remaining_contents] objects have changed since the "
+                f"checkpoint, restart from sub task {self.sub_task}"
+            )
+            self.checkpoint = None
+            return contents, 0
+
+        if self.sub_task < len(listings) - 1:
+            return [], 0
+
+        self.sent_keys = set(self.checkpoint["sent_keys"])
+        remaining_contents = []
+        skip_rows = 0
+        for content in contents:
+            if content["Key"] in self.sent_keys:
+                continue
+
+            if content["Key"] == self.checkpoint["key"]:
+                remaining_contents.insert(0, content)
+                skip_rows = self.checkpoint["rows"]
+            else:
+                remaining_contents.append(content)
+
+        return remaining_contents, skip_rows
+
+    def save_checkpoint(self, content: dict, rows: Union[int, None]) -> None:
+        """Called when the generator resumes after a page of content, rows is the
+        rows of content sent so far. rows None marks content as sent, after its
+        last page.
+
+        A page writes the checkpoint of the page before it, see the class.
+        """
+        if self.checkpoint_key is None:
+            return
+
+        key = content["Key"]
+        if rows is None:
+            self.sent_keys.add(key)
+            key = None
+        elif self.pending_checkpoint is not None:
+            self.checkpoint = self.pending_checkpoint
+            self.state_store_connector.set(
+                _NAMESPACE, self.checkpoint_key, self.checkpoint
+            )
+
+        self.pending_checkpoint = {
+            "listings": list(self.listings),
+            "sent_keys": sorted(self.sent_keys),
+            "key": key,
+            "rows": rows,
+            "updated_at": time.time(),
+        }
+
+    def delete_checkpoint(self) -> None:
+        if self.checkpoint_key is None:
+            return
+
+        self.state_store_connector.delete(_NAMESPACE, self.checkpoint_key)
+        self.checkpoint = None
+        self.pending_checkpoint = None
+
+    @staticmethod
+    def _make_listing_hash(contents: list) -> str:
+        listing = json.dumps(
+            [[content["Key"], content.get("ETag")] for content in contents]
+        )
+        return hashlib.sha256(listing.encode("utf-8")).hexdigest()
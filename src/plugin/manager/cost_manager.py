@@ -1,15 +1,104 @@
 import logging
-from typing import Generator
-from datetime import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from types import MappingProxyType
+from typing import Callable, Generator, Iterable, Union
+from datetime import datetime, timedelta
 from dateutil import rrule
+from dateutil.relativedelta import relativedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from spaceone.core import utils
 from spaceone.core.manager import BaseManager
 from spaceone.core.error import *
+from spaceone.cost_analysis.plugin.data_source.model.cost_response import Cost
 from ..connector.aws_s3_connector import AWSS3Connector
 from ..connector.spaceone_connector import SpaceONEConnector
+from ..lib.task_metrics import TaskMetrics
+from .checkpoint_manager import CheckpointManager
+from .manifest_manager import ManifestManager
 
 _LOGGER = logging.getLogger(__name__)
+_DEFAULT_PREFETCH_SIZE = 4
+_DEFAULT_PREFETCH_MAX_BYTES = 512 * 1024 * 1024
+_CLOSED_MONTH_GRACE_DAYS = 10
+_DEFAULT_OBJECT_CACHE_PATH = os.path.join(
+    tempfile.gettempdir(), "aws-hyperbilling-objects"
+)
+_DEFAULT_OBJECT_CACHE_MAX_BYTES = 10 * 1024 * 1024 * 1024
+_DEFAULT_PAGE_ROWS = 2000
+_DEFAULT_PAGE_MIN_ROWS = 100
+_DEFAULT_PAGE_MAX_ROWS = 20000
+_DEFAULT_PAGE_MAX_BYTES = 1024 * 1024
+_DEFAULT_PAGE_TARGET_SECONDS = 1.0
+# field names, provider and Account ID that every record adds to its values
+_RECORD_FIXED_BYTES = 192
+_TAGS_CACHE_SIZE = 65536
+_EMPTY_TAGS = MappingProxyType({})
+_COST_DATA_COLUMNS = [
+    "usage_date",
+    "region",
+    "service_code",
+    "usage_type",
+    "instance_type",
+    "usage_quantity",
+    "usage_cost",
+    "tags",
+]
+# aggregate_keys -> columns of _transform_cost_table, Account ID is the same
+# for every row of a task
+_AGGREGATE_KEY_COLUMNS = {
+    "billed_date": "billed_date",
+    "region_code": "region_code",
+    "product": "product",
+    "usage_type": "usage_type",
+    "usage_unit": "usage_unit",
+    "tags": "tags",
+    "Instance Type": "instance_type",
+    "Usage Type Details": "usage_type_details",
+    "Account ID": None,
+}
+# billed_date is required. usage_unit is only set for data transfer and
+# CloudFront, the unit of any other usage_quantity is given by its usage_type,
+# so rows of different usage types are never summed
+_AGGREGATE_REQUIRED_COLUMNS = [
+    "billed_date",
+    "usage_type",
+    "usage_unit",
+    "usage_type_details",
+]
+_COST_MODEL_FIELDS = {
+    "cost",
+    "usage_quantity",
+    "usage_unit",
+    "provider",
+    "region_code",
+    "product",
+    "usage_type",
+    "billed_date",
+    "additional_info",
+    "tags",
+}
+
+# process-wide pool of decode workers, created by the first task that uses it
+_DECODE_POOL = None
+_DECODE_POOL_SIZE = 0
+_DECODE_POOL_LOCK = threading.Lock()
 
 _REGION_MAP = {
     "APE1": "ap-east-1",
@@ -47,22 +136,99 @@ _REGION_MAP = {
 }
 
 
+class _PageSizer:
+    """Number of rows of the next response page, adapted after every page so
+    that a page stays under max_bytes and is built within target_seconds. Bytes are the size of the values as they are sent, see
+    _get_page_nbytes.
+    """
+
+    def __init__(
+        self, max_bytes: int, target_seconds: float, min_rows: int, max_rows: int
+    ):
+        self.max_bytes = max_bytes
+        self.target_seconds = target_seconds
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.rows = min(max(_DEFAULT_PAGE_ROWS, min_rows), max_rows)
+
+    def fit(self, batch: pa.RecordBatch) -> None:
+        # before the first page of an object is cut, rows can only shrink
+        row_bytes = _get_page_nbytes(batch) / max(batch.num_rows, 1)
+        rows = min(self.rows, self.max_bytes / max(row_bytes, 1))
+        self.rows = int(min(max(rows, self.min_rows), self.max_rows))
+
+    def update(self, num_rows: int, nbytes: int, seconds: float) -> None:
+        rows = num_rows * self.max_bytes / max(nbytes, 1)
+        if self.target_seconds and seconds > 0:
+            rows = min(rows, num_rows * self.target_seconds / seconds)
+
+        # move half way, a single slow page should not swing the size
+        rows = (self.rows + rows) / 2
+        self.rows = int(min(max(rows, self.min_rows), self.max_rows))
+
+
 class CostManager(BaseManager):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.aws_s3_connector = AWSS3Connector()
         self.space_connector = SpaceONEConnector()
+        self.manifest_mgr = ManifestManager()
+        self.checkpoint_mgr = CheckpointManager()
+        self.metrics = TaskMetrics()
 
     def get_data(
         self, options: dict, secret_data: dict, task_options: dict, schema: str = None
     ) -> Generator[dict, None, None]:
-        task_type = task_options.get("task_type", "identity")
+        synced_at = time.time()
+
+        self.metrics = self._make_task_metrics(options, task_options)
+        self.aws_s3_connector.metrics = self.metrics
+        self.space_connector.metrics = self.metrics
+        self.metrics.start_profile()
+
+        try:
+            self.aws_s3_connector.create_session(options, secret_data, schema)
 
-        self.aws_s3_connector.create_session(options, secret_data, schema)
-        self._check_task_options(task_options)
+            # a batched task runs the tasks of its accounts one after another
+            sub_tasks = task_options.get("sub_tasks", [task_options])
+            for sub_task_options in sub_tasks:
+                self._check_task_options(sub_task_options)
+
+            if options.get("checkpoint", False):
+                self.checkpoint_mgr.init_checkpoint(
+                    options, self.aws_s3_connector.s3_bucket, task_options
+                )
+
+            month_contents = {}
+            for index, sub_task_options in enumerate(sub_tasks):
+                self.checkpoint_mgr.start_sub_task(index)
+                task_month_contents = yield from self.metrics.time_consumer(
+                    self._get_task_data(options, secret_data, sub_task_options, schema),
+                    "consumer_wait",
+                )
+                month_contents.update(task_month_contents)
+
+            if options.get("incremental_sync", False):
+                self.manifest_mgr.init_store(options)
+                for path, contents in month_contents.items():
+                    self.manifest_mgr.update_manifest(
+                        self.aws_s3_connector.s3_bucket, path, contents, synced_at
+                    )
+
+            self.checkpoint_mgr.delete_checkpoint()
+        finally:
+            self.metrics.stop_profile()
+            self.metrics.export(options.get("metrics_exporters"))
+
+    def _get_task_data(
+        self, options: dict, secret_data: dict, task_options: dict, schema: str = None
+    ) -> Generator[dict, None, dict]:
+        """Yield the cost data of one account and return the listed month contents."""
+        task_type = task_options.get("task_type", "identity")
 
         start = task_options["start"]
+        end = task_options.get("end")
         account_id = task_options["account_id"]
         database = task_options["database"]
 
@@ -70,26 +236,294 @@ class CostManager(BaseManager):
         if task_type == "identity":
             service_account_id = task_options["service_account_id"]
             is_sync = task_options["is_sync"]
-            if is_sync == "false":
+            is_sync_updated = task_options.get("is_sync_updated", "false")
+            if is_sync == "false" and is_sync_updated == "false":
                 self._update_sync_state(
                     options, secret_data, schema, service_account_id
                 )
 
-        date_ranges = self._get_date_range(start)
+        list_cache_ttl = options.get("list_cache_ttl")
+
+        date_ranges = self._get_date_range(start, end)
+        if options.get("month_planner", True):
+            date_ranges = self._plan_months(
+                database, account_id, date_ranges, list_cache_ttl
+            )
 
         include_credit = options.get("include_credit", True)
+        output_format = options.get("output_format", "dict")
+        group_columns = self._get_group_columns(options)
+        prefetch_size = options.get("prefetch_size", _DEFAULT_PREFETCH_SIZE)
+        prefetch_max_bytes = options.get(
+            "prefetch_max_bytes", _DEFAULT_PREFETCH_MAX_BYTES
+        )
+
+        page_sizer = _PageSizer(
+            options.get("page_max_bytes", _DEFAULT_PAGE_MAX_BYTES),
+            options.get("page_target_seconds", _DEFAULT_PAGE_TARGET_SECONDS),
+            options.get("page_min_rows", _DEFAULT_PAGE_MIN_ROWS),
+            options.get("page_max_rows", _DEFAULT_PAGE_MAX_ROWS),
+        )
 
+        month_contents = self._list_cost_objects(
+            database, account_id, date_ranges, list_cache_ttl
+        )
+        contents = [
+            content for contents in month_contents.values() for content in contents
+        ]
+        # a retried task skips what the server already received
+        contents, skip_rows = self.checkpoint_mgr.get_remaining_contents(contents)
+        self.metrics.add("objects", len(contents))
+        row_filter = self._make_row_filter(include_credit)
+
+        use_object_cache = options.get("object_cache", False)
+        if use_object_cache:
+            self.aws_s3_connector.init_object_cache(
+                options.get("object_cache_path", _DEFAULT_OBJECT_CACHE_PATH),
+                options.get("object_cache_max_bytes", _DEFAULT_OBJECT_CACHE_MAX_BYTES),
+            )
+
+        # only objects of closed months are worth caching, open months change daily
+        closed_keys = {
+            content["Key"]
+            for date, contents in zip(date_ranges, month_contents.values())
+            if self.is_closed_month(date)
+            for content in contents
+        }
+
+        cached_keys = closed_keys if use_object_cache else set()
+
+        decode_processes = options.get("decode_processes", 0)
+        if decode_processes > 0:
+            decode_object = self._make_object_decoder(
+                row_filter,
+                include_credit,
+                group_columns,
+                cached_keys,
+                _get_decode_pool(decode_processes),
+            )
+            # decoded pages are many times the listed size of the object
+            decoded_objects = self._prefetch_objects(
+                contents,
+                decode_object,
+                prefetch_size,
+                prefetch_max_bytes,
+                lambda pages: pages.size(),
+            )
+
+            # the worker already transformed the pages
+            make_page = partial(
+                self._make_cost_page,
+                account_id=account_id,
+                output_format=output_format,
+            )
+
+            for content, pages in decoded_objects:
+                with pages:
+                    rows = skip_rows
+                    if pages.size() > 0:
+                        batches = _skip_rows(pa.ipc.open_stream(pages), rows)
+                        for table, page in _iter_pages(batches, page_sizer, make_page):
+                            yield page
+
+                            rows += table.num_rows
+                            self.checkpoint_mgr.save_checkpoint(content, rows)
+
+                skip_rows = 0
+                self.checkpoint_mgr.save_checkpoint(content, None)
+
+            return month_contents
+
+        prefetched_objects = self._prefetch_objects(
+            contents,
+            self._make_object_opener(row_filter, cached_keys),
+            prefetch_size,
+            prefetch_max_bytes,
+        )
+
+        for content, source in prefetched_objects:
+            batches = self.aws_s3_connector.iter_cost_batches(
+                content["Key"],
+                source=source,
+                columns=_COST_DATA_COLUMNS,
+                row_filter=row_filter,
+            )
+            batches = self.metrics.iter_timed(batches, "parquet_decode")
+
+            if group_columns:
+                batches = list(batches)
+                with self.metrics.timer("transform"):
+                    tables = _aggregate_cost_tables(
+                        [
+                            self._transform_cost_table(batch, include_credit)
+                            for batch in batches
+                        ],
+                        group_columns,
+                    )
+                    batches = [
+                        batch for table in tables for batch in table.to_batches()
+                    ]
+
+                make_page = partial(
+                    self._make_cost_page,
+                    account_id=account_id,
+                    output_format=output_format,
+                )
+            else:
+                make_page = partial(
+                    self._make_cost_data,
+                    account_id=account_id,
+                    include_credit=include_credit,
+                    output_format=output_format,
+                )
+
+            rows = skip_rows
+            batches = _skip_rows(batches, rows)
+            for table, page in _iter_pages(batches, page_sizer, make_page):
+                yield page
+
+                rows += table.num_rows
+                self.checkpoint_mgr.save_checkpoint(content, rows)
+
+            skip_rows = 0
+            self.checkpoint_mgr.save_checkpoint(content, None)
+
+        return month_contents
+
+    def _list_cost_objects(
+        self,
+        database: str,
+        account_id: str,
+        date_ranges: list,
+        list_cache_ttl: int = None,
+    ) -> dict:
+        paths = []
+        closed_paths = []
         for date in date_ranges:
-            year, month = date.split("-")
-            path = f"SPACE_ONE/billing/database={database}/account_id={account_id}/year={year}/month={month}"
-            response = self.aws_s3_connector.list_objects(path)
-            contents = response.get("Contents", [])
+            path = self.aws_s3_connector.get_month_path(database, account_id, date)
+            paths.append(path)
+
+            if self.is_closed_month(date):
+                closed_paths.append(path)
+
+        month_contents = self.aws_s3_connector.list_objects_by_paths(
+            paths, closed_paths, list_cache_ttl
+        )
+
+        return dict(zip(paths, month_contents))
+
+    def _plan_months(
+        self,
+        database: str,
+        account_id: str,
+        date_ranges: list,
+        list_cache_ttl: int = None,
+    ) -> list:
+        """Drop the closed months without a partition, e.g. the months before an
+        account was created. Open months are always kept, their partition may
+        be created after the months were listed.
+        """
+        years = sorted({date.split("-")[0] for date in date_ranges})
+
+        # only worth it if there are fewer years than months to list
+        if len(years) >= len(date_ranges):
+            return date_ranges
+
+        # only years whose months are all closed are cached, a month of the
+        # current year may be backfilled after the year was listed
+        closed_years = [year for year in years if self.is_closed_month(f"{year}-12")]
+        existing_months = self.aws_s3_connector.list_months(
+            database, account_id, years, closed_years, list_cache_ttl
+        )
+        planned_ranges = [
+            date
+            for date in date_ranges
+            if date in existing_months or not self.is_closed_month(date)
+        ]
+
+        self.metrics.add("months_skipped", len(date_ranges) - len(planned_ranges))
+        return planned_ranges
+
+    def _make_object_opener(self, row_filter, cached_keys: set) -> Callable:
+        """open_object(content) of _prefetch_objects, objects in cached_keys are
+        read through the object cache.
+        """
+
+        def _open_object(content):
+            return self.aws_s3_connector.open_cost_object(
+                content["Key"],
+                content.get("Size"),
+                _COST_DATA_COLUMNS,
+                row_filter,
+                content.get("ETag"),
+                content["Key"] in cached_keys,
+            )
+
+        return _open_object
+
+    def _make_object_decoder(
+        self,
+        row_filter,
+        include_credit: bool,
+        group_columns: list,
+        cached_keys: set,
+        decode_pool: ProcessPoolExecutor,
+    ) -> Callable:
+        """open_object(content) of _prefetch_objects that returns the pages of the
+        object decoded and transformed by decode_pool as an IPC stream.
+        """
+        decode_args = (_COST_DATA_COLUMNS, row_filter, include_credit, group_columns)
+
+        def _decode_object(content):
+            key = content["Key"]
+            source = self.aws_s3_connector.get_cost_object_source(
+                key, content.get("ETag"), key in cached_keys
+            )
+
+            try:
+                with self.metrics.timer("parquet_decode"):
+                    pages = decode_pool.submit(_decode_cost_object, source, *decode_args)
+                    return pa.BufferReader(pages.result())
+            except FileNotFoundError:
+                # evicted from the object cache before the worker opened it
+                source = self.aws_s3_connector.get_cost_object_source(key)
+                with self.metrics.timer("parquet_decode"):
+                    pages = decode_pool.submit(_decode_cost_object, source, *decode_args)
+                    return pa.BufferReader(pages.result())
+
+        return _decode_object
+
+    @staticmethod
+    def _prefetch_objects(
+        contents: Iterable[dict],
+        open_object: Callable,
+        prefetch_size: int,
+        prefetch_max_bytes: int,
+        get_result_size: Callable = None,
+    ) -> Generator[tuple, None, None]:
+        """Open the next objects in background threads while the current one is
+        yielded, which also starts their download. Objects are yielded in listing
+        order. The total size of opened but not yet consumed objects is kept
+        under prefetch_max_bytes, except that at least one object is always in
+        flight. See _prefetch_in_order for get_result_size.
+        """
+        if prefetch_size < 1:
             for content in contents:
-                response_stream = self.aws_s3_connector.get_cost_data(content["Key"])
-                for results in response_stream:
-                    yield self._make_cost_data(results, account_id, include_credit)
+                yield content, open_object(content)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=prefetch_size)
 
-        yield {"results": []}
+        try:
+            yield from _prefetch_in_order(
+                contents,
+                lambda content: executor.submit(open_object, content),
+                prefetch_size,
+                prefetch_max_bytes,
+                get_result_size,
+            )
+        finally:
+            executor.shutdown(wait=True)
 
     def _update_sync_state(self, options, secret_data, schema, service_account_id):
         self.space_connector.init_client(options, secret_data, schema)
@@ -100,9 +534,9 @@ class CostManager(BaseManager):
         tags["is_sync"] = "true"
         self.space_connector.update_service_account(service_account_id, tags)
 
-    def _make_cost_data(self, results, account_id, include_credit):
-        costs_data = []
-
+    def _make_cost_data(
+        self, batch, account_id, include_credit, output_format="dict"
+    ):
         """ Source Data Model
         class CostSummaryItem(BaseModel):
             usage_date: str
@@ -120,77 +554,221 @@ class CostManager(BaseManager):
             usage_cost: float
         """
 
-        for result in results:
-            try:
-                region = result["region"] or "USE1"
-                service_code = result["service_code"]
-                usage_type = result["usage_type"]
+        try:
+            with self.metrics.timer("transform"):
+                table = self._transform_cost_table(batch, include_credit)
+                costs_data = self._convert_to_cost_records(
+                    table, account_id, output_format
+                )
+        except Exception as e:
+            _LOGGER.error(f"[_make_cost_data] make data error: {e}", exc_info=True)
+            raise e
+
+        self.metrics.add("rows", len(costs_data))
+        self.metrics.add("pages")
+        return {"results": costs_data}
+
+    def _make_cost_page(self, table: pa.Table, account_id, output_format: str) -> dict:
+        # table is already transformed, by a decode worker or by the aggregation
+        with self.metrics.timer("transform"):
+            costs_data = self._convert_to_cost_records(table, account_id, output_format)
+
+        self.metrics.add("rows", len(costs_data))
+        self.metrics.add("pages")
+        return {"results": costs_data}
+
+    @staticmethod
+    def _get_group_columns(options: dict) -> Union[list, None]:
+        aggregate_keys = options.get("aggregate_keys")
+        if not aggregate_keys:
+            return None
+
+        group_columns = list(_AGGREGATE_REQUIRED_COLUMNS)
+        for key in aggregate_keys:
+            if key not in _AGGREGATE_KEY_COLUMNS:
+                raise ERROR_INVALID_PARAMETER(
+                    key="options.aggregate_keys",
+                    reason=f"unknown key {key}, should be in "
+                    f"{list(_AGGREGATE_KEY_COLUMNS)}",
+                )
+
+            column = _AGGREGATE_KEY_COLUMNS[key]
+            if column and column not in group_columns:
+                group_columns.append(column)
+
+        return group_columns
+
+    @staticmethod
+    def _make_task_metrics(options: dict, task_options: dict) -> TaskMetrics:
+        profile = options.get("profile_task")
+        if profile and random.random() >= options.get("profile_sample_rate", 1.0):
+            profile = None
+
+        task = {
+            key: task_options[key]
+            for key in ["account_id", "database", "start", "end"]
+            if key in task_options
+        }
+        if "sub_tasks" in task_options:
+            task["sub_tasks"] = len(task_options["sub_tasks"])
+
+        return TaskMetrics(task, profile)
+
+    @staticmethod
+    def _make_row_filter(include_credit: bool) -> Union[pc.Expression, None]:
+        if include_credit:
+            return None
+
+        # rows without service_code are kept, like in _transform_cost_table
+        service_code = pc.field("service_code")
+        return (service_code != "Credit") | service_code.is_null()
+
+    @staticmethod
+    def _transform_cost_table(batch, include_credit: bool) -> pa.Table:
+        if isinstance(batch, pa.RecordBatch):
+            table = pa.Table.from_batches([batch])
+        else:
+            table = batch
+
+        if not include_credit:
+            is_not_credit = pc.not_equal(table["service_code"], "Credit")
+            table = table.filter(pc.fill_null(is_not_credit, True))
+
+        num_rows = table.num_rows
+        service_code = _as_dictionary(table["service_code"])
+        usage_type = _as_dictionary(table["usage_type"])
+
+        region = _as_dictionary(table["region"])
+        region_code = pc.fill_null(
+            _map_dictionary(region, _get_region_code), _get_region_code(None)
+        )
+
+        if "usage_cost" in table.column_names:
+            cost = pc.fill_null(pc.cast(table["usage_cost"], pa.float64()), 0.0)
+        else:
+            cost = pa.array([0.0] * num_rows, pa.float64())
+
+        if "tags" in table.column_names:
+            tags = _as_dictionary(table["tags"])
+        else:
+            tags = _as_dictionary(pa.nulls(num_rows, pa.string()))
+
+        is_transfer = pc.fill_null(pc.equal(service_code, "AWSDataTransfer"), False)
+        is_cloudfront = pc.fill_null(pc.equal(service_code, "AmazonCloudFront"), False)
+        has_in_bytes = _contains_after_start(usage_type, "-In-Bytes")
+        has_out_bytes = _contains_after_start(usage_type, "-Out-Bytes")
+        has_https = _contains_after_start(usage_type, "-HTTPS")
 
-                if not include_credit and service_code == "Credit":
-                    continue
+        null_str = pa.scalar(None, pa.string())
 
-                data = {
-                    "cost": result.get("usage_cost", 0.0) or 0.0,
-                    "usage_quantity": result["usage_quantity"],
-                    "usage_unit": None,
+        transfer_details = pc.if_else(
+            has_in_bytes,
+            "Transfer In",
+            pc.if_else(has_out_bytes, "Transfer Out", "Transfer Etc"),
+        )
+        cloudfront_details = pc.if_else(
+            has_https,
+            "HTTPS Requests",
+            pc.if_else(has_out_bytes, "Transfer Out", "HTTP Requests"),
+        )
+        cloudfront_unit = pc.if_else(
+            pc.and_(pc.invert(has_https), has_out_bytes), "GB", "Count"
+        )
+
+        usage_unit = pc.if_else(
+            is_transfer,
+            "Bytes",
+            pc.if_else(is_cloudfront, cloudfront_unit, null_str),
+        )
+        usage_type_details = pc.if_else(
+            is_transfer,
+            transfer_details,
+            pc.if_else(is_cloudfront, cloudfront_details, null_str),
+        )
+
+        return pa.table(
+            {
+                "cost": cost,
+                "usage_quantity": table["usage_quantity"],
+                "usage_unit": usage_unit,
+                "region_code": region_code,
+                "product": service_code,
+                "usage_type": usage_type,
+                "billed_date": _as_dictionary(table["usage_date"]),
+                "instance_type": _as_dictionary(table["instance_type"]),
+                "usage_type_details": usage_type_details,
+                "tags": tags,
+            }
+        )
+
+    @staticmethod
+    def _convert_to_cost_records(
+        table: pa.Table, account_id, output_format: str = "dict"
+    ) -> list:
+        """output_format "model" returns the records as Cost models of the plugin
+        server, which it accepts without validating every field of every record.
+        """
+        tags = _as_dictionary(table["tags"])
+        parsed_tags = [
+            _parse_tags(tags_str) for tags_str in tags.dictionary.to_pylist()
+        ]
+        parsed_tags.append(_parse_tags(None))
+        if output_format == "model":
+            # models are converted to messages as they are, Struct needs a dict
+            parsed_tags = [dict(tags) for tags in parsed_tags]
+
+        # rows without tags point to the last entry
+        tags_indices = pc.fill_null(tags.indices, len(parsed_tags) - 1).to_pylist()
+
+        columns = zip(
+            table["cost"].to_pylist(),
+            table["usage_quantity"].to_pylist(),
+            _to_interned_pylist(table["usage_unit"]),
+            _to_interned_pylist(table["region_code"]),
+            _to_interned_pylist(table["product"]),
+            _to_interned_pylist(table["usage_type"]),
+            _to_interned_pylist(table["billed_date"]),
+            _to_interned_pylist(table["instance_type"]),
+            _to_interned_pylist(table["usage_type_details"]),
+            tags_indices,
+        )
+
+        if output_format == "model":
+            return _make_cost_models(columns, account_id, parsed_tags)
+
+        costs_data = []
+        for (
+            cost,
+            usage_quantity,
+            usage_unit,
+            region_code,
+            product,
+            usage_type,
+            billed_date,
+            instance_type,
+            usage_type_details,
+            tags_index,
+        ) in columns:
+            costs_data.append(
+                {
+                    "cost": cost,
+                    "usage_quantity": usage_quantity,
+                    "usage_unit": usage_unit,
                     "provider": "aws",
-                    "region_code": _REGION_MAP.get(region, region),
-                    "product": service_code,
+                    "region_code": region_code,
+                    "product": product,
                     "usage_type": usage_type,
-                    "billed_date": result["usage_date"],
+                    "billed_date": billed_date,
                     "additional_info": {
-                        "Instance Type": result["instance_type"],
+                        "Instance Type": instance_type,
                         "Account ID": account_id,
+                        "Usage Type Details": usage_type_details,
                     },
-                    "tags": self._get_tags_from_cost_data(result),
+                    "tags": parsed_tags[tags_index],
                 }
+            )
 
-                if service_code == "AWSDataTransfer":
-                    data["usage_unit"] = "Bytes"
-                    if usage_type.find("-In-Bytes") > 0:
-                        data["additional_info"]["Usage Type Details"] = "Transfer In"
-                    elif usage_type.find("-Out-Bytes") > 0:
-                        data["additional_info"]["Usage Type Details"] = "Transfer Out"
-                    else:
-                        data["additional_info"]["Usage Type Details"] = "Transfer Etc"
-                elif service_code == "AmazonCloudFront":
-                    if usage_type.find("-HTTPS") > 0:
-                        data["usage_unit"] = "Count"
-                        data["additional_info"]["Usage Type Details"] = "HTTPS Requests"
-                    elif usage_type.find("-Out-Bytes") > 0:
-                        data["usage_unit"] = "GB"
-                        data["additional_info"]["Usage Type Details"] = "Transfer Out"
-                    else:
-                        data["usage_unit"] = "Count"
-                        data["additional_info"]["Usage Type Details"] = "HTTP Requests"
-                else:
-                    data["additional_info"]["Usage Type Details"] = None
-
-            except Exception as e:
-                _LOGGER.error(f"[_make_cost_data] make data error: {e}", exc_info=True)
-                raise e
-
-            costs_data.append(data)
-
-        return {"results": costs_data}
-
-    @staticmethod
-    def _get_tags_from_cost_data(cost_data: dict) -> dict:
-        tags = {}
-
-        if tags_str := cost_data.get("tags"):
-            try:
-                tags_dict: dict = utils.load_json(tags_str)
-                for key, value in tags_dict.items():
-                    # todo: remove this condition after fixing the issue
-                    if "." in key:
-                        continue
-                    key = key.replace("user:", "")
-                    tags[key] = value
-            except Exception as e:
-                _LOGGER.debug(e)
-
-        return tags
+        return costs_data
 
     @staticmethod
     def _check_task_options(task_options: dict):
@@ -214,12 +792,384 @@ class CostManager(BaseManager):
                 raise ERROR_REQUIRED_PARAMETER(key="task_options.service_account_id")
 
     @staticmethod
-    def _get_date_range(start):
+    def _get_date_range(start, end=None):
         date_ranges = []
         start_time = datetime.strptime(start, "%Y-%m")
-        now = datetime.utcnow()
-        for dt in rrule.rrule(rrule.MONTHLY, dtstart=start_time, until=now):
+        if end:
+            until = datetime.strptime(end, "%Y-%m")
+        else:
+            until = datetime.utcnow()
+
+        for dt in rrule.rrule(rrule.MONTHLY, dtstart=start_time, until=until):
             billed_month = dt.strftime("%Y-%m")
             date_ranges.append(billed_month)
 
         return date_ranges
+
+    @staticmethod
+    def is_closed_month(date: str) -> bool:
+        # billing data of a month can still be corrected for a few days after it ends
+        month_end = datetime.strptime(date, "%Y-%m") + relativedelta(months=1)
+        return month_end + timedelta(days=_CLOSED_MONTH_GRACE_DAYS) < datetime.utcnow()
+
+
+@lru_cache(maxsize=_TAGS_CACHE_SIZE)
+def _parse_tags(tags_str: str) -> MappingProxyType:
+    # rows with the same tags string share one read-only mapping
+    if not tags_str:
+        return _EMPTY_TAGS
+
+    try:
+        if orjson:
+            tags_dict: dict = orjson.loads(tags_str)
+        else:
+            tags_dict: dict = utils.load_json(tags_str)
+
+        # todo: remove the "." condition after fixing the issue
+        tags = {
+            key.replace("user:", ""): value
+            for key, value in tags_dict.items()
+            if "." not in key
+        }
+    except Exception as e:
+        _LOGGER.debug(e)
+        return _EMPTY_TAGS
+
+    return MappingProxyType(tags)
+
+
+def _decode_cost_object(
+    source: Union[str, bytes],
+    columns: list,
+    row_filter: Union[pc.Expression, None],
+    include_credit: bool,
+    group_columns: list = None,
+) -> pa.Buffer:
+    """Runs in a decode worker process. source is a cached file path or the
+    object content, the transformed (and aggregated) pages are returned as an
+    Arrow IPC stream.
+    """
+    if isinstance(source, str):
+        file = pa.memory_map(source)
+    else:
+        file = pa.BufferReader(source)
+
+    sink = pa.BufferOutputStream()
+    writer = None
+
+    with file:
+        tables = (
+            CostManager._transform_cost_table(batch, include_credit)
+            for batch in AWSS3Connector.read_cost_batches(file, columns, row_filter)
+        )
+        if group_columns:
+            tables = _aggregate_cost_tables(list(tables), group_columns)
+
+        for table in tables:
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_stream(sink, schema)
+            elif table.schema != schema:
+                table = table.cast(schema)
+
+            writer.write_table(table)
+
+    if writer is not None:
+        writer.close()
+
+    return sink.getvalue()
+
+
+def _aggregate_cost_tables(tables: list, group_columns: list) -> list:
+    """Sum cost and usage_quantity of the rows of transformed tables that have
+    the same group_columns. Other columns are left empty. Groups keep the order
+    of their first row, so the result of an object is always the same.
+    """
+    if not tables:
+        return []
+
+    # the batches of an object come with their own dictionaries
+    table = pa.concat_tables(tables).unify_dictionaries()
+    grouped = table.group_by(group_columns, use_threads=False).aggregate(
+        [("cost", "sum"), ("usage_quantity", "sum")]
+    )
+
+    columns = {}
+    for field in table.schema:
+        if field.name in ("cost", "usage_quantity"):
+            columns[field.name] = grouped[f"{field.name}_sum"]
+        elif field.name in group_columns:
+            columns[field.name] = grouped[field.name]
+        else:
+            columns[field.name] = pa.nulls(grouped.num_rows, field.type)
+
+    return [pa.table(columns)]
+
+
+def _get_decode_pool(max_workers: int) -> ProcessPoolExecutor:
+    global _DECODE_POOL, _DECODE_POOL_SIZE
+
+    with _DECODE_POOL_LOCK:
+        if _DECODE_POOL is None:
+            # spawn, forking a process with gRPC and boto3 threads is not safe
+            _DECODE_POOL = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _DECODE_POOL_SIZE = max_workers
+        elif max_workers != _DECODE_POOL_SIZE:
+            # the pool is shared by every task of the process
+            _LOGGER.warning(
+                f"[_get_decode_pool] decode_processes {max_workers} is ignored, "
+                f"the decode pool already has {_DECODE_POOL_SIZE} processes"
+            )
+
+    return _DECODE_POOL
+
+
+def _iter_pages(
+    batches: Iterable[pa.RecordBatch], page_sizer: _PageSizer, make_page: Callable
+) -> Generator[tuple, None, None]:
+    """Re-cut the batches of one object into pages of page_sizer.rows rows and
+    yield (table, make_page(table)) of every page. The time of a page is the
+    time to build it: pulling its batches, which decodes them, and make_page.
+    The time the consumer holds the page is not counted.
+    """
+    buffered = []
+    buffered_rows = 0
+    is_first_batch = True
+    started_at = time.monotonic()
+
+    for batch in batches:
+        if is_first_batch:
+            page_sizer.fit(batch)
+            is_first_batch = False
+
+        buffered.append(batch)
+        buffered_rows += batch.num_rows
+
+        while buffered_rows >= page_sizer.rows:
+            table = pa.Table.from_batches(buffered)
+            rest = table.slice(page_sizer.rows)
+            table = table.slice(0, page_sizer.rows)
+            buffered = rest.to_batches()
+            buffered_rows = rest.num_rows
+
+            page = make_page(table)
+            seconds = time.monotonic() - started_at
+            page_sizer.update(table.num_rows, _get_page_nbytes(table), seconds)
+
+            yield table, page
+            started_at = time.monotonic()
+
+    if buffered_rows > 0:
+        table = pa.Table.from_batches(buffered)
+        yield table, make_page(table)
+
+
+def _get_page_nbytes(table: Union[pa.Table, pa.RecordBatch]) -> int:
+    """Size of the rows as records, dictionary-encoded columns count the value
+    of every row instead of its index.
+    """
+    nbytes = table.num_rows * _RECORD_FIXED_BYTES
+    for column in table.columns:
+        chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+        for chunk in chunks:
+            nbytes += _get_values_nbytes(chunk)
+
+    return nbytes
+
+
+def _get_values_nbytes(values: pa.Array) -> int:
+    if pa.types.is_dictionary(values.type):
+        if _is_binary_like(values.dictionary.type):
+            lengths = pc.take(pc.binary_length(values.dictionary), values.indices)
+            return pc.sum(lengths).as_py() or 0
+
+        return values.dictionary.nbytes * len(values) // max(len(values.dictionary), 1)
+
+    if _is_binary_like(values.type):
+        return pc.sum(pc.binary_length(values)).as_py() or 0
+
+    return values.nbytes
+
+
+def _is_binary_like(data_type: pa.DataType) -> bool:
+    return (
+        pa.types.is_string(data_type)
+        or pa.types.is_large_string(data_type)
+        or pa.types.is_binary(data_type)
+        or pa.types.is_large_binary(data_type)
+    )
+
+
+def _skip_rows(
+    batches: Iterable[pa.RecordBatch], rows: int
+) -> Generator[pa.RecordBatch, None, None]:
+    # drops the first rows, those were received before the task was retried
+    for batch in batches:
+        if rows >= batch.num_rows:
+            rows -= batch.num_rows
+            continue
+
+        yield batch.slice(rows) if rows else batch
+        rows = 0
+
+
+def _prefetch_in_order(
+    contents: Iterable[dict],
+    submit: Callable,
+    prefetch_size: int,
+    prefetch_max_bytes: int,
+    get_result_size: Callable = None,
+) -> Generator[tuple, None, None]:
+    """submit(content) starts opening an object and returns a concurrent Future.
+
+    Objects in flight count with their listed Size. With get_result_size, an
+    opened object counts with the size of its result instead, e.g. its decoded
+    pages, and an object still being opened with its listed Size times the
+    largest result to Size ratio seen so far.
+    """
+    contents = iter(contents)
+    pending = deque()
+    size_ratio = 1.0
+
+    def _get_in_flight_bytes():
+        nonlocal size_ratio
+
+        in_flight_bytes = 0
+        for content, future in pending:
+            size = content.get("Size", 0)
+            if get_result_size and _is_opened(future):
+                result_size = get_result_size(future.result())
+                size_ratio = max(size_ratio, result_size / max(size, 1))
+                in_flight_bytes += result_size
+            else:
+                in_flight_bytes += size * size_ratio
+
+        return in_flight_bytes
+
+    try:
+        next_content = next(contents, None)
+        while next_content or pending:
+            while next_content and len(pending) < prefetch_size:
+                if pending:
+                    # also updates size_ratio from the objects opened meanwhile
+                    in_flight_bytes = _get_in_flight_bytes()
+                    size = next_content.get("Size", 0) * size_ratio
+                    if in_flight_bytes + size > prefetch_max_bytes:
+                        break
+
+                pending.append((next_content, submit(next_content)))
+                next_content = next(contents, None)
+
+            content, future = pending.popleft()
+            yield content, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+        futures.wait([future for _, future in pending])
+
+        for _, future in pending:
+            if _is_opened(future):
+                future.result().close()
+
+
+def _is_opened(future: futures.Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+def _make_cost_models(columns: Iterable[tuple], account_id, parsed_tags: list) -> list:
+    """Cost models of the column values zipped by _convert_to_cost_records.
+    construct skips validation, the values are already of the field types.
+    """
+    # rows with the same values share one additional_info, like their tags
+    additional_infos = {}
+
+    costs_data = []
+    for (
+        cost,
+        usage_quantity,
+        usage_unit,
+        region_code,
+        product,
+        usage_type,
+        billed_date,
+        instance_type,
+        usage_type_details,
+        tags_index,
+    ) in columns:
+        additional_info = additional_infos.get((instance_type, usage_type_details))
+        if additional_info is None:
+            additional_info = {
+                "Instance Type": instance_type,
+                "Account ID": account_id,
+                "Usage Type Details": usage_type_details,
+            }
+            additional_infos[(instance_type, usage_type_details)] = additional_info
+
+        costs_data.append(
+            Cost.construct(
+                _fields_set=_COST_MODEL_FIELDS,
+                cost=cost,
+                usage_quantity=usage_quantity,
+                usage_unit=usage_unit,
+                provider="aws",
+                region_code=region_code,
+                product=product,
+                usage_type=usage_type,
+                billed_date=billed_date,
+                additional_info=additional_info,
+                tags=parsed_tags[tags_index],
+            )
+        )
+
+    return costs_data
+
+
+def _get_region_code(region: Union[str, None]) -> str:
+    region = region or "USE1"
+    return _REGION_MAP.get(region, region)
+
+
+def _as_dictionary(values) -> pa.DictionaryArray:
+    if isinstance(values, pa.ChunkedArray):
+        # also unifies the dictionaries of the chunks
+        values = values.combine_chunks()
+
+    if not pa.types.is_dictionary(values.type):
+        values = pc.dictionary_encode(values)
+
+    return values
+
+
+def _map_dictionary(values: pa.DictionaryArray, func) -> pa.DictionaryArray:
+    # func runs once per dictionary entry instead of once per row
+    dictionary = pa.array(
+        [func(value) for value in values.dictionary.to_pylist()],
+        values.dictionary.type,
+    )
+    return pa.DictionaryArray.from_arrays(values.indices, dictionary)
+
+
+def _to_interned_pylist(values) -> list:
+    # rows share one interned str object per distinct value
+    values = _as_dictionary(values)
+    dictionary = [
+        sys.intern(value) if isinstance(value, str) else value
+        for value in values.dictionary.to_pylist()
+    ]
+    dictionary.append(None)
+
+    indices = pc.fill_null(values.indices, len(dictionary) - 1)
+    return list(map(dictionary.__getitem__, indices.to_pylist()))
+
+
+def _contains_after_start(values, pattern: str):
+    # same as `value.find(pattern) > 0`, a match at index 0 does not count
+    if pa.types.is_dictionary(values.type):
+        found = _contains_after_start(values.dictionary, pattern)
+        return pc.fill_null(pc.take(found, values.indices), False)
+
+    return pc.fill_null(pc.greater(pc.find_substring(values, pattern), 0), False)
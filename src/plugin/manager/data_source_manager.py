@@ -44,8 +44,9 @@ class DataSourceManager(BaseManager):
             space_connector.init_client(options, secret_data, schema)
             space_connector.verify_plugin(domain_id)
 
+        # a cached session would skip checking the credential with STS
         aws_s3_connector = AWSS3Connector()
-        aws_s3_connector.create_session(options, secret_data, schema)
+        aws_s3_connector.create_session(options, secret_data, schema, use_cache=False)
 
     @staticmethod
     def _check_options(options: dict):
@@ -1,15 +1,26 @@
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Generator
 
+from spaceone.core import utils
 from spaceone.core.error import *
 from spaceone.core.manager import BaseManager
 
 from ..connector.aws_s3_connector import AWSS3Connector
 from ..connector.spaceone_connector import SpaceONEConnector
+from .manifest_manager import ManifestManager
+from .task_plan_manager import TaskPlanManager
 
 _LOGGER = logging.getLogger("spaceone")
 _DEFAULT_DATABASE = "MZC"
 _DEFAULT_RESYNC_DAYS = 10
+_DEFAULT_PAGE_SIZE = 100
+_DEFAULT_PAGE_CONCURRENCY = 4
+_DEFAULT_UPDATE_CONCURRENCY = 8
+_DEFAULT_PROBE_CONCURRENCY = 8
 
 
 class JobManager(BaseManager):
@@ -17,6 +28,8 @@ class JobManager(BaseManager):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.space_connector = SpaceONEConnector()
+        self.manifest_mgr = ManifestManager()
+        self.task_plan_mgr = TaskPlanManager()
 
     def get_tasks(
         self,
@@ -34,24 +47,55 @@ class JobManager(BaseManager):
 
         start_month = self._get_start_month(options, start, last_synchronized_at)
         self.space_connector.init_client(options, secret_data, schema)
-        response = self.space_connector.list_projects(domain_id)
-        total_count = response.get("total_count") or 0
 
-        if total_count > 0:
-            project_info = response["results"][0]
+        incremental_sync = self._is_incremental_sync(
+            options, start, last_synchronized_at
+        )
+        task_target_bytes = options.get("task_target_bytes")
+
+        if incremental_sync or task_target_bytes:
+            aws_s3_connector = AWSS3Connector()
+            aws_s3_connector.create_session(options, secret_data, schema)
+
+        if incremental_sync:
+            self.manifest_mgr.init_store(options)
+
+        page_size = options.get("spaceone_page_size", _DEFAULT_PAGE_SIZE)
+        page_concurrency = options.get(
+            "spaceone_page_concurrency", _DEFAULT_PAGE_CONCURRENCY
+        )
+
+        projects = self._list_all_results(
+            partial(self.space_connector.list_projects, domain_id),
+            page_size,
+            page_concurrency,
+        )
+
+        # first sync accounts, their is_sync tag is updated in bulk after listing
+        sync_state_updates = []
+
+        has_project = False
+        for project_info in projects:
+            has_project = True
             _LOGGER.debug(f"[get_tasks] project info: {project_info}")
 
             project_id = project_info["project_id"]
-            database = project_info.get("tags", {}).get("database", _DEFAULT_DATABASE)
-
-            response = self.space_connector.list_service_accounts(project_id)
-            for service_account_info in response.get("results", []):
+            project_database = project_info.get("tags", {}).get(
+                "database", _DEFAULT_DATABASE
+            )
+
+            service_accounts = self._list_all_results(
+                partial(self.space_connector.list_service_accounts, project_id),
+                page_size,
+                page_concurrency,
+            )
+            for service_account_info in service_accounts:
                 service_account_tags = service_account_info.get("tags", {})
                 service_account_id = service_account_info["service_account_id"]
                 service_account_name = service_account_info["name"]
                 account_id = service_account_info["data"]["account_id"]
                 is_sync = service_account_tags.get("is_sync", "false")
-                database = service_account_tags.get("database", database)
+                database = service_account_tags.get("database", project_database)
 
                 if is_sync != "true":
                     is_sync = "false"
@@ -78,6 +122,28 @@ class JobManager(BaseManager):
                         "filter": {"additional_info.Account ID": account_id},
                     }
 
+                    sync_state_updates.append((task_options, service_account_tags))
+
+                elif incremental_sync:
+                    changed_month = self.manifest_mgr.get_first_changed_month(
+                        aws_s3_connector,
+                        database,
+                        account_id,
+                        start_month,
+                        last_synchronized_at,
+                    )
+                    if changed_month is None:
+                        _LOGGER.debug(
+                            f"[get_tasks] skip unchanged account: {account_id}"
+                        )
+                        continue
+
+                    task_options["start"] = changed_month
+                    task_changed = {
+                        "start": changed_month,
+                        "filter": {"additional_info.Account ID": account_id},
+                    }
+
                 else:
                     task_options["start"] = start_month
                     task_changed = {"start": start_month}
@@ -86,7 +152,23 @@ class JobManager(BaseManager):
                     {"task_options": task_options, "task_changed": task_changed}
                 )
 
-            changed.append({"start": start_month})
+        self._update_sync_states(
+            sync_state_updates,
+            options.get("spaceone_update_concurrency", _DEFAULT_UPDATE_CONCURRENCY),
+        )
+
+        if has_project:
+            # accounts skipped by incremental sync must keep their data
+            if not incremental_sync:
+                changed.append({"start": start_month})
+
+            if task_target_bytes and tasks:
+                tasks, batch_changed = self.task_plan_mgr.plan_tasks(
+                    aws_s3_connector, tasks, task_target_bytes
+                )
+                changed.extend(batch_changed)
+
+            self._set_run_id(tasks)
 
             _LOGGER.debug(f"[get_tasks] tasks: {tasks}")
             _LOGGER.debug(f"[get_tasks] changed: {changed}")
@@ -114,46 +196,189 @@ class JobManager(BaseManager):
         start_month: str = self._get_start_month(options, start, last_synchronized_at)
 
         database = options.get("database", _DEFAULT_DATABASE)
-        accounts = secret_data.get("accounts", [])
-
-        path = f"SPACE_ONE/billing/database={database}/"
-
-        if not accounts:
-            response = aws_s3_connector.list_objects(path, delimiter="/")
-            path_length = len(path)
-
-            for prefix in response.get("CommonPrefixes", []):
-                folder = prefix["Prefix"]
-                relative_path = folder[path_length:].lstrip("/")
+        accounts = self._list_accounts_with_data(
+            aws_s3_connector,
+            database,
+            start_month,
+            secret_data.get("accounts", []),
+            options.get("account_probe_concurrency", _DEFAULT_PROBE_CONCURRENCY),
+        )
 
-                if relative_path:
-                    first_folder = relative_path.split("/")[0]
-                    if first_folder.startswith("account_id="):
-                        account_id = first_folder.split("=", 1)[-1]
-                        if account_id and account_id.strip():
-                            accounts.append(account_id)
+        incremental_sync = self._is_incremental_sync(
+            options, start, last_synchronized_at
+        )
+        if incremental_sync:
+            self.manifest_mgr.init_store(options)
 
         for account_id in accounts:
+            task_start_month = start_month
+
+            if incremental_sync:
+                task_start_month = self.manifest_mgr.get_first_changed_month(
+                    aws_s3_connector,
+                    database,
+                    account_id,
+                    start_month,
+                    last_synchronized_at,
+                )
+                if task_start_month is None:
+                    _LOGGER.debug(f"[get_tasks] skip unchanged account: {account_id}")
+                    continue
+
             task_options = {
                 "account_id": account_id,
                 "database": database,
-                "start": start_month,
+                "start": task_start_month,
                 "is_sync": "true",
                 "task_type": "directory",
             }
             task_changed = {
-                "start": start_month,
+                "start": task_start_month,
                 "filter": {"additional_info.Account ID": account_id},
             }
             tasks.append({"task_options": task_options, "task_changed": task_changed})
 
-        changed.append({"start": start_month})
+        # accounts skipped by incremental sync must keep their data
+        if not incremental_sync:
+            changed.append({"start": start_month})
+
+        task_target_bytes = options.get("task_target_bytes")
+        if task_target_bytes and tasks:
+            tasks, batch_changed = self.task_plan_mgr.plan_tasks(
+                aws_s3_connector, tasks, task_target_bytes
+            )
+            changed.extend(batch_changed)
+
+        self._set_run_id(tasks)
 
         _LOGGER.debug(f"[get_tasks] tasks: {tasks}")
         _LOGGER.debug(f"[get_tasks] changed: {changed}")
 
         return {"tasks": tasks, "changed": changed}
 
+    @staticmethod
+    def _set_run_id(tasks: list) -> None:
+        # checkpoints are keyed by task_options, only a retry of a task of
+        # this job resumes one
+        run_id = utils.generate_id("run")
+        for task in tasks:
+            task["task_options"]["run_id"] = run_id
+
+    @staticmethod
+    def _list_accounts_with_data(
+        aws_s3_connector: AWSS3Connector,
+        database: str,
+        start_month: str,
+        accounts: list,
+        probe_concurrency: int,
+    ) -> list:
+        """Return the accounts that have billing data since start_month, in order.
+        Without configured accounts, the account_id= prefixes of the database are
+        listed page by page, and every account is probed as soon as it is listed.
+        """
+        path = f"SPACE_ONE/billing/database={database}/"
+
+        def _iter_account_ids():
+            path_length = len(path)
+            for folder in aws_s3_connector.list_common_prefixes(path):
+                first_folder = folder[path_length:].strip("/").split("/")[0]
+                if first_folder.startswith("account_id="):
+                    account_id = first_folder.split("=", 1)[-1]
+                    if account_id and account_id.strip():
+                        yield account_id
+
+        def _has_data(account_id):
+            # month paths sort in time order, so any key after start_month is newer
+            month_path = aws_s3_connector.get_month_path(
+                database, account_id, start_month
+            )
+            return aws_s3_connector.has_objects_after(
+                f"{path}account_id={account_id}/", month_path
+            )
+
+        account_ids = accounts or _iter_account_ids()
+
+        with ThreadPoolExecutor(max_workers=max(probe_concurrency, 1)) as executor:
+            probes = [
+                (account_id, executor.submit(_has_data, account_id))
+                for account_id in account_ids
+            ]
+
+        accounts_with_data = []
+        for account_id, probe in probes:
+            if probe.result():
+                accounts_with_data.append(account_id)
+            else:
+                _LOGGER.debug(f"[get_tasks] skip account without data: {account_id}")
+
+        return accounts_with_data
+
+    def _update_sync_states(
+        self, sync_state_updates: list, update_concurrency: int
+    ) -> None:
+        """Set is_sync=true on first sync service accounts with the tags from
+        ServiceAccount.list. Tasks whose update succeeded are marked, so that
+        Cost.get_data does not update them again.
+        """
+
+        def _update_sync_state(sync_state_update):
+            task_options, tags = sync_state_update
+            service_account_id = task_options["service_account_id"]
+
+            try:
+                self.space_connector.update_service_account(
+                    service_account_id, {**tags, "is_sync": "true"}
+                )
+                task_options["is_sync_updated"] = "true"
+            except Exception as e:
+                _LOGGER.warning(
+                    f"[_update_sync_states] failed to update service account "
+                    f"({service_account_id}), retry in Cost.get_data: {e}"
+                )
+
+        if not sync_state_updates:
+            return
+
+        max_workers = max(min(update_concurrency, len(sync_state_updates)), 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_update_sync_state, sync_state_updates))
+
+    @staticmethod
+    def _list_all_results(
+        list_func: Callable, page_size: int, page_concurrency: int
+    ) -> Generator[dict, None, None]:
+        """Yield the results of every page of a SpaceONE list API in order.
+        The first page tells the total count, the remaining pages are fetched
+        with up to page_concurrency requests in flight.
+        """
+        response = list_func(page={"start": 1, "limit": page_size})
+        yield from response.get("results", [])
+
+        total_count = response.get("total_count") or 0
+        page_starts = range(1 + page_size, total_count + 1, page_size)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=max(page_concurrency, 1)) as executor:
+            for page_start in page_starts:
+                page = {"start": page_start, "limit": page_size}
+                pending.append(executor.submit(list_func, page=page))
+
+                if len(pending) >= page_concurrency:
+                    yield from pending.popleft().result().get("results", [])
+
+            while pending:
+                yield from pending.popleft().result().get("results", [])
+
+    @staticmethod
+    def _is_incremental_sync(
+        options: dict, start: str = None, last_synchronized_at: datetime = None
+    ) -> bool:
+        # an explicit start or the first sync of a data source always does a full sync
+        if start or last_synchronized_at is None:
+            return False
+
+        return options.get("incremental_sync", False)
+
     def _get_start_month(
         self,
         options: dict,
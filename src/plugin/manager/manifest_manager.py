@@ -0,0 +1,142 @@
+import logging
+from datetime import datetime, timezone
+from typing import Union
+from dateutil import rrule
+
+from spaceone.core.manager import BaseManager
+from ..connector.aws_s3_connector import AWSS3Connector
+from ..connector.state_store_connector import StateStoreConnector
+
+_LOGGER = logging.getLogger(__name__)
+_NAMESPACE = "manifest"
+
+
+class ManifestManager(BaseManager):
+    """Keeps track of the S3 objects that were already synced, per month prefix.
+
+    manifest: {
+        '<s3 key>': {
+            'etag': 'str',
+            'size': 'int',
+            'last_modified': 'str',
+            'synced_at': 'float'    # epoch time of the task that first synced this version
+        }
+    }
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state_store_connector = StateStoreConnector()
+
+    def init_store(self, options: dict) -> None:
+        self.state_store_connector.init_store(options)
+
+    def get_first_changed_month(
+        self,
+        aws_s3_connector: AWSS3Connector,
+        database: str,
+        account_id: str,
+        start_month: str,
+        last_synchronized_at: datetime,
+    ) -> Union[str, None]:
+        months = self._get_months(start_month)
+        paths = [
+            aws_s3_connector.get_month_path(database, account_id, month)
+            for month in months
+        ]
+        month_contents = aws_s3_connector.list_objects_by_paths(paths)
+        synced_before = self._to_timestamp(last_synchronized_at)
+
+        for month, path, contents in zip(months, paths, month_contents):
+            if not self._is_synced(
+                aws_s3_connector.s3_bucket, path, contents, synced_before
+            ):
+                return month
+
+        return None
+
+    def update_manifest(
+        self, bucket: str, path: str, contents: list, synced_at: float
+    ) -> None:
+        manifest_key = f"{bucket}/{path}"
+        previous_manifest = (
+            self.state_store_connector.get(_NAMESPACE, manifest_key) or {}
+        )
+
+        if not contents and not previous_manifest:
+            return
+
+        manifest = {}
+        for content in contents:
+            entry = self._make_entry(content)
+            previous_entry = previous_manifest.get(content["Key"], {})
+
+            # keep the first sync time of an unchanged object
+            if self._is_same_version(entry, previous_entry):
+                entry["synced_at"] = previous_entry["synced_at"]
+            else:
+                entry["synced_at"] = synced_at
+
+            manifest[content["Key"]] = entry
+
+        self.state_store_connector.set(_NAMESPACE, manifest_key, manifest)
+
+    def _is_synced(
+        self, bucket: str, path: str, contents: list, synced_before: float
+    ) -> bool:
+        """Objects only count as synced if they were synced before the last
+        successful sync of the data source. Entries written by a task whose job
+        later failed therefore never hide changed data.
+        """
+        manifest = self.state_store_connector.get(_NAMESPACE, f"{bucket}/{path}") or {}
+
+        if set(manifest.keys()) != {content["Key"] for content in contents}:
+            return False
+
+        for content in contents:
+            entry = manifest[content["Key"]]
+            if not self._is_same_version(self._make_entry(content), entry):
+                return False
+
+            if entry["synced_at"] >= synced_before:
+                return False
+
+        return True
+
+    @staticmethod
+    def _make_entry(content: dict) -> dict:
+        last_modified = content.get("LastModified")
+        if isinstance(last_modified, datetime):
+            last_modified = last_modified.isoformat()
+
+        return {
+            "etag": content.get("ETag"),
+            "size": content.get("Size"),
+            "last_modified": last_modified,
+        }
+
+    @staticmethod
+    def _is_same_version(entry: dict, previous_entry: dict) -> bool:
+        if not previous_entry:
+            return False
+
+        return (
+            entry["etag"] == previous_entry.get("etag")
+            and entry["size"] == previous_entry.get("size")
+            and entry["last_modified"] == previous_entry.get("last_modified")
+        )
+
+    @staticmethod
+    def _get_months(start_month: str) -> list:
+        start_time = datetime.strptime(start_month, "%Y-%m")
+        now = datetime.utcnow()
+        return [
+            dt.strftime("%Y-%m")
+            for dt in rrule.rrule(rrule.MONTHLY, dtstart=start_time, until=now)
+        ]
+
+    @staticmethod
+    def _to_timestamp(dt: datetime) -> float:
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
@@ -0,0 +1,185 @@
+import copy
+import logging
+from datetime import datetime
+from dateutil import rrule
+
+from spaceone.core.manager import BaseManager
+from ..connector.aws_s3_connector import AWSS3Connector
+from .cost_manager import CostManager
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TaskPlanManager(BaseManager):
+    """Resizes the tasks of Job.get_tasks by the size of their billing objects.
+
+    An account with more than target_bytes is split into tasks over consecutive
+    months, accounts with less are batched into one task with sub_tasks:
+
+    task_options: {
+        'task_type': 'str',
+        'database': 'str',
+        'start': 'str',         # first month of all sub tasks
+        'is_sync': 'str',
+        'sub_tasks': 'list'     # task_options of the batched accounts
+    }
+    """
+
+    def plan_tasks(
+        self,
+        aws_s3_connector: AWSS3Connector,
+        tasks: list,
+        target_bytes: int,
+    ) -> tuple:
+        """Return the planned tasks and the changed entries of batched tasks,
+        which have to be added to the changed list of the job.
+        """
+        task_month_sizes = self._get_month_sizes(aws_s3_connector, tasks)
+
+        planned_tasks = []
+        small_tasks = []
+        for task, month_sizes in zip(tasks, task_month_sizes):
+            total_size = sum(size for _, size in month_sizes)
+
+            if total_size > target_bytes:
+                planned_tasks.extend(
+                    self._split_task(task, month_sizes, target_bytes)
+                )
+            else:
+                small_tasks.append((task, total_size))
+
+        changed = []
+        for batch in self._make_batches(small_tasks, target_bytes):
+            batch_task, batch_changed = self._merge_tasks(batch)
+            planned_tasks.append(batch_task)
+            changed.extend(batch_changed)
+
+        _LOGGER.debug(
+            f"[plan_tasks] {len(tasks)} tasks are planned as {len(planned_tasks)} tasks"
+        )
+
+        return planned_tasks, changed
+
+    def _get_month_sizes(self, aws_s3_connector: AWSS3Connector, tasks: list) -> list:
+        task_months = []
+        paths = []
+        closed_paths = []
+        for task in tasks:
+            task_options = task["task_options"]
+            months = self._get_months(task_options["start"], task_options.get("end"))
+            task_months.append(months)
+
+            for month in months:
+                path = aws_s3_connector.get_month_path(
+                    task_options["database"], task_options["account_id"], month
+                )
+                paths.append(path)
+
+                if CostManager.is_closed_month(month):
+                    closed_paths.append(path)
+
+        # listings of closed months are shared with Cost.get_data through the cache
+        month_contents = iter(
+            aws_s3_connector.list_objects_by_paths(paths, closed_paths)
+        )
+
+        task_month_sizes = []
+        for months in task_months:
+            month_sizes = []
+            for month in months:
+                contents = next(month_contents)
+                month_sizes.append(
+                    (month, sum(content.get("Size", 0) for content in contents))
+                )
+
+            task_month_sizes.append(month_sizes)
+
+        return task_month_sizes
+
+    @staticmethod
+    def _split_task(task: dict, month_sizes: list, target_bytes: int) -> list:
+        month_ranges = []
+        range_size = 0
+        for month, size in month_sizes:
+            if month_ranges and range_size + size <= target_bytes:
+                month_ranges[-1][1] = month
+                range_size += size
+            else:
+                month_ranges.append([month, month])
+                range_size = size
+
+        # the last range stays open, like the task it was split from
+        month_ranges[-1][1] = task["task_options"].get("end")
+
+        split_tasks = []
+        for start, end in month_ranges:
+            task_options = copy.deepcopy(task["task_options"])
+            task_changed = copy.deepcopy(task["task_changed"])
+            task_options["start"] = start
+            task_changed["start"] = start
+            task_options.pop("end", None)
+            task_changed.pop("end", None)
+
+            if end:
+                task_options["end"] = end
+                task_changed["end"] = end
+
+            split_tasks.append(
+                {"task_options": task_options, "task_changed": task_changed}
+            )
+
+        return split_tasks
+
+    @staticmethod
+    def _make_batches(small_tasks: list, target_bytes: int) -> list:
+        batches = []
+        batch_size = 0
+        for task, size in small_tasks:
+            if batches and batch_size + size <= target_bytes:
+                batches[-1].append(task)
+                batch_size += size
+            else:
+                batches.append([task])
+                batch_size = size
+
+        return batches
+
+    @staticmethod
+    def _merge_tasks(tasks: list) -> tuple:
+        if len(tasks) == 1:
+            return tasks[0], []
+
+        sub_tasks = [task["task_options"] for task in tasks]
+        first_task_options = sub_tasks[0]
+        task_options = {
+            "task_type": first_task_options.get("task_type", "identity"),
+            "database": first_task_options["database"],
+            "start": min(sub_task["start"] for sub_task in sub_tasks),
+            "is_sync": "true",
+            "sub_tasks": sub_tasks,
+        }
+
+        task_changed_list = [task["task_changed"] for task in tasks]
+        if all(
+            task_changed == task_changed_list[0] for task_changed in task_changed_list
+        ):
+            return {
+                "task_options": task_options,
+                "task_changed": task_changed_list[0],
+            }, []
+
+        # one task_changed can not filter several accounts, the job changed can
+        return {"task_options": task_options}, task_changed_list
+
+    @staticmethod
+    def _get_months(start_month: str, end_month: str = None) -> list:
+        start_time = datetime.strptime(start_month, "%Y-%m")
+        if end_month:
+            until = datetime.strptime(end_month, "%Y-%m")
+        else:
+            until = datetime.utcnow()
+
+        return [
+            dt.strftime("%Y-%m")
+            for dt in rrule.rrule(rrule.MONTHLY, dtstart=start_time, until=until)
+        ]
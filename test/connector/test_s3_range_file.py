@@ -0,0 +1,187 @@
+import io
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from conftest import BUCKET
+from plugin.connector.aws_s3_connector import AWSS3Connector
+from plugin.connector.s3_range_file import (
+    S3RangeFile,
+    _COALESCE_GAP_SIZE,
+    _FOOTER_READ_SIZE,
+    _FULL_READ_MAX_SIZE,
+    _MAX_RANGE_SIZE,
+)
+from plugin.lib.task_metrics import TaskMetrics
+
+_MIB = 1024 * 1024
+
+
+def _put_object(s3_client, key: str, data: bytes) -> None:
+    s3_client.put_object(Bucket=BUCKET, Key=key, Body=data)
+
+
+def _open(s3_client, key: str, data: bytes) -> S3RangeFile:
+    return S3RangeFile(s3_client, BUCKET, key, len(data), TaskMetrics())
+
+
+def _get_calls(source: S3RangeFile) -> int:
+    return source.metrics.stages["s3_download"][1]
+
+
+def _make_billing_table(rows: int, credit_rows: int) -> pa.Table:
+    # random payload so that the object is larger than a whole-object read
+    payload = [os.urandom(48).hex() for _ in range(rows)]
+    return pa.table(
+        {
+            "usage_date": ["2024-01-01"] * rows,
+            "service_code": ["Credit"] * credit_rows
+            + ["AmazonEC2"] * (rows - credit_rows),
+            "usage_cost": [float(index) for index in range(rows)],
+            "tags": payload,
+        }
+    )
+
+
+def test_coalesce_ranges():
+    ranges = [
+        (3000, 100),
+        (0, 1000),
+        (1000 + _COALESCE_GAP_SIZE, 10),
+        (10 * _MIB, 100),
+    ]
+
+    assert S3RangeFile._coalesce_ranges(ranges) == [
+        (0, 1000 + _COALESCE_GAP_SIZE + 10),
+        (10 * _MIB, 100),
+    ]
+
+
+def test_coalesce_ranges_max_size():
+    half = _MAX_RANGE_SIZE // 2 + 1
+    ranges = [(0, half), (half, half)]
+
+    assert S3RangeFile._coalesce_ranges(ranges) == ranges
+
+
+def test_small_object_is_read_with_one_get(s3_client):
+    data = os.urandom(_FULL_READ_MAX_SIZE)
+    _put_object(s3_client, "small", data)
+
+    with _open(s3_client, "small", data) as source:
+        assert source.is_fully_loaded
+        source.set_read_plan([[(0, 10)]])
+        assert source.read() == data
+        source.seek(-100, io.SEEK_END)
+        assert source.read(100) == data[-100:]
+        assert _get_calls(source) == 1
+
+
+def test_large_object_reads_only_the_footer_on_open(s3_client):
+    data = os.urandom(_FULL_READ_MAX_SIZE + 1)
+    _put_object(s3_client, "large", data)
+
+    with _open(s3_client, "large", data) as source:
+        assert not source.is_fully_loaded
+        assert source.metrics.counters["s3_bytes"] == _FOOTER_READ_SIZE
+
+        source.seek(-_FOOTER_READ_SIZE, io.SEEK_END)
+        assert source.read() == data[-_FOOTER_READ_SIZE:]
+        assert _get_calls(source) == 1
+
+
+def test_read_plan_prefetches_next_group_and_releases_previous(s3_client):
+    data = os.urandom(_FULL_READ_MAX_SIZE * 2)
+    _put_object(s3_client, "planned", data)
+    groups = [
+        [(0, 1000), (2000, 1000)],
+        [(4 * _MIB, 1000)],
+        [(8 * _MIB, 1000)],
+    ]
+
+    with _open(s3_client, "planned", data) as source:
+        source.set_read_plan(groups)
+
+        source.seek(2500)
+        assert source.read(100) == data[2500:2600]
+        # the first group is coalesced into one GET, the second is read ahead
+        assert sorted(source._group_futures) == [0, 1]
+        assert len(source._group_futures[0]) == 1
+
+        # a group that was already read ahead still moves the window
+        for future in source._group_futures[1]:
+            future.result()
+
+        source.seek(4 * _MIB)
+        assert source.read(1000) == data[4 * _MIB : 4 * _MIB + 1000]
+        assert sorted(source._group_futures) == [1, 2]
+
+        source.seek(8 * _MIB + 10)
+        assert source.read(10) == data[8 * _MIB + 10 : 8 * _MIB + 20]
+        assert sorted(source._group_futures) == [2]
+
+        # footer, one GET per group
+        assert _get_calls(source) == 4
+
+
+def test_read_outside_the_plan_falls_back_to_a_ranged_get(s3_client):
+    data = os.urandom(_FULL_READ_MAX_SIZE * 2)
+    _put_object(s3_client, "unplanned", data)
+
+    with _open(s3_client, "unplanned", data) as source:
+        source.set_read_plan([[(0, 1000)]])
+
+        # past the end of the planned range
+        source.seek(500)
+        assert source.read(1000) == data[500:1500]
+
+        source.seek(3 * _MIB)
+        assert source.read(100) == data[3 * _MIB : 3 * _MIB + 100]
+
+
+def _read_cost_object(s3_client, key: str, size: int, columns: list, row_filter):
+    aws_s3_connector = AWSS3Connector()
+    aws_s3_connector.s3_client = s3_client
+    aws_s3_connector.s3_bucket = BUCKET
+
+    batches = aws_s3_connector.iter_cost_batches(
+        key, columns=columns, row_filter=row_filter, size=size
+    )
+    table = pa.Table.from_batches(list(batches))
+    return table, aws_s3_connector.metrics.counters["s3_bytes"]
+
+
+def test_open_cost_object_fetches_only_the_needed_column_chunks(s3_client):
+    rows = 200000
+    credit_rows = 100000
+    table = _make_billing_table(rows, credit_rows)
+    body = io.BytesIO()
+    pq.write_table(table, body, row_group_size=20000)
+    data = body.getvalue()
+    assert len(data) > _FULL_READ_MAX_SIZE
+    _put_object(s3_client, "billing.parquet", data)
+
+    columns = ["usage_date", "service_code", "usage_cost"]
+    expected = table.select(columns)
+
+    result, fetched_bytes = _read_cost_object(
+        s3_client, "billing.parquet", len(data), columns, None
+    )
+    assert result.column_names == columns
+    assert result["usage_cost"].to_pylist() == expected["usage_cost"].to_pylist()
+    # the tags column is never fetched
+    assert fetched_bytes < len(data) / 10
+
+    row_filter = pc.field("service_code") != "Credit"
+    result, filtered_bytes = _read_cost_object(
+        s3_client, "billing.parquet", len(data), columns, row_filter
+    )
+    assert result.column_names == columns
+    assert (
+        result["usage_cost"].to_pylist()
+        == expected.slice(credit_rows)["usage_cost"].to_pylist()
+    )
+    # row groups with only credits are skipped by their statistics
+    assert filtered_bytes < fetched_bytes * 0.7
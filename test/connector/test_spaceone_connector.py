@@ -0,0 +1,73 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from plugin.connector.spaceone_connector import SpaceONEConnector
+from plugin.lib import event_loop
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # status codes of the next responses, then 200
+    statuses = []
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.requests.append((self.path, json.loads(body)))
+
+        status = self.statuses.pop(0) if self.statuses else 200
+        response = {"detail": "error"} if status >= 400 else {"tags": {"a": "b"}}
+        data = json.dumps(response).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def space_connector():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    _Handler.statuses = []
+    _Handler.requests = []
+    space_connector = SpaceONEConnector()
+    space_connector.init_client(
+        {"spaceone_retry_backoff": 0},
+        {
+            "spaceone_endpoint": f"http://127.0.0.1:{server.server_port}",
+            "spaceone_client_secret": "token",
+        },
+    )
+    try:
+        yield space_connector
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_dispatch_async_retries_unavailable(space_connector):
+    _Handler.statuses = [503, 502]
+
+    response = event_loop.run(space_connector.get_service_account_async("sa-1"))
+
+    assert response == {"tags": {"a": "b"}}
+    assert _Handler.requests == [
+        ("/service-account/get", {"service_account_id": "sa-1"})
+    ] * 3
+
+
+def test_dispatch_async_raises_after_the_last_retry(space_connector):
+    _Handler.statuses = [503] * 4
+
+    with pytest.raises(Exception, match="HTTP 503 Error"):
+        event_loop.run(space_connector.get_service_account_async("sa-1"))
+
+    assert len(_Handler.requests) == 4
@@ -0,0 +1,90 @@
+import boto3
+import pytest
+from moto.server import ThreadedMotoServer
+
+from conftest import BUCKET
+from plugin.connector import aws_s3_connector
+from plugin.connector.aws_s3_connector import AWSS3Connector
+from plugin.manager.async_cost_manager import AsyncCostManager
+from plugin.manager.cost_manager import CostManager
+from test_cost_manager import _DATABASE, _MONTH, _SECRET_DATA, _make_billing_parquet
+
+_PORT = 5123
+
+
+@pytest.fixture(scope="module")
+def moto_server():
+    # mock_aws only patches botocore, aiobotocore needs a real endpoint
+    server = ThreadedMotoServer(port=_PORT, verbose=False)
+    server.start()
+    try:
+        yield f"http://127.0.0.1:{_PORT}"
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def s3_server_client(moto_server, monkeypatch):
+    monkeypatch.setenv("AWS_ENDPOINT_URL", moto_server)
+    # sessions and listings of the server must not be reused by other tests
+    monkeypatch.setattr(aws_s3_connector, "_SESSION_CACHE", {})
+    monkeypatch.setattr(aws_s3_connector, "_LIST_CACHE", {})
+    s3_client = boto3.client(
+        "s3",
+        region_name="us-east-1",
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    s3_client.create_bucket(Bucket=BUCKET)
+    return s3_client
+
+
+def _get_records(cost_mgr, options: dict, account_id: str) -> list:
+    task_options = {
+        "task_type": "directory",
+        "start": _MONTH,
+        "end": _MONTH,
+        "account_id": account_id,
+        "database": _DATABASE,
+        "is_sync": "true",
+    }
+
+    records = []
+    for page in cost_mgr.get_data(options, _SECRET_DATA, task_options):
+        records.extend(page["results"])
+
+    return records
+
+
+@pytest.mark.parametrize("async_concurrency", [1, 4])
+def test_get_data_is_the_same_as_the_thread_engine(s3_server_client, async_concurrency):
+    account_id = "111111111111"
+    path = AWSS3Connector.get_month_path(_DATABASE, account_id, _MONTH)
+    # a small object is read with one GET, the large one by column chunks
+    for index, rows in enumerate([1000, 800000]):
+        s3_server_client.put_object(
+            Bucket=BUCKET,
+            Key=f"{path}/part-{index:05d}.parquet",
+            Body=_make_billing_parquet(rows, 100000),
+        )
+
+    options = {"include_credit": False, "async_concurrency": async_concurrency}
+    records = _get_records(AsyncCostManager(), options, account_id)
+
+    assert len(records) > 500000
+    assert records == _get_records(CostManager(), options, account_id)
+
+
+def test_get_data_with_decode_processes(s3_server_client):
+    account_id = "222222222222"
+    path = AWSS3Connector.get_month_path(_DATABASE, account_id, _MONTH)
+    s3_server_client.put_object(
+        Bucket=BUCKET,
+        Key=f"{path}/part-00000.parquet",
+        Body=_make_billing_parquet(10000, 1000),
+    )
+
+    options = {"decode_processes": 2}
+    records = _get_records(AsyncCostManager(), options, account_id)
+
+    assert records == _get_records(CostManager(), options, account_id)
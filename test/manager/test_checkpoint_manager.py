@@ -0,0 +1,90 @@
+from plugin.manager.checkpoint_manager import CheckpointManager
+
+_BUCKET = "hyperbilling-test"
+_TASK_OPTIONS = {"account_id": "123456789012", "start": "2024-01"}
+
+
+def _make_contents(*keys: str) -> list:
+    return [{"Key": key, "ETag": f'"{key}"'} for key in keys]
+
+
+def _init_checkpoint(tmp_path, task_options: dict = None) -> CheckpointManager:
+    checkpoint_mgr = CheckpointManager()
+    checkpoint_mgr.init_checkpoint(
+        {"state_store_path": str(tmp_path)}, _BUCKET, task_options or _TASK_OPTIONS
+    )
+    return checkpoint_mgr
+
+
+def _stop_in_sub_task(tmp_path, sub_tasks: list) -> None:
+    """Receives the sub tasks but the last one, which stops after a, c and
+    100 rows of b. The page after those 100 rows was sent but not received."""
+    checkpoint_mgr = _init_checkpoint(tmp_path)
+    for index, contents in enumerate(sub_tasks[:-1]):
+        checkpoint_mgr.start_sub_task(index)
+        contents, _ = checkpoint_mgr.get_remaining_contents(contents)
+        for content in contents:
+            checkpoint_mgr.save_checkpoint(content, None)
+
+    checkpoint_mgr.start_sub_task(len(sub_tasks) - 1)
+    a, b, c = checkpoint_mgr.get_remaining_contents(sub_tasks[-1])[0]
+    checkpoint_mgr.save_checkpoint(a, None)
+    checkpoint_mgr.save_checkpoint(c, None)
+    checkpoint_mgr.save_checkpoint(b, 100)
+    checkpoint_mgr.save_checkpoint(b, 200)
+
+
+def test_retry_skips_the_sent_keys(tmp_path):
+    first_contents = _make_contents("x", "y")
+    contents = _make_contents("a", "b", "c")
+    _stop_in_sub_task(tmp_path, [first_contents, contents])
+
+    checkpoint_mgr = _init_checkpoint(tmp_path)
+    checkpoint_mgr.start_sub_task(0)
+    assert checkpoint_mgr.get_remaining_contents(first_contents) == ([], 0)
+
+    checkpoint_mgr.start_sub_task(1)
+    assert checkpoint_mgr.get_remaining_contents(contents) == ([contents[1]], 100)
+
+
+def test_changed_listing_restarts_the_sub_task(tmp_path):
+    first_contents = _make_contents("x", "y")
+    contents = _make_contents("a", "b", "c")
+    _stop_in_sub_task(tmp_path, [first_contents, contents])
+
+    # an object was added or rewritten since the checkpoint
+    checkpoint_mgr = _init_checkpoint(tmp_path)
+    checkpoint_mgr.start_sub_task(0)
+    assert checkpoint_mgr.get_remaining_contents(first_contents) == ([], 0)
+
+    checkpoint_mgr.start_sub_task(1)
+    new_contents = _make_contents("0", "a", "b", "c")
+    assert checkpoint_mgr.get_remaining_contents(new_contents) == (new_contents, 0)
+
+
+def test_checkpoint_of_another_run_is_not_resumed(tmp_path):
+    contents = _make_contents("a", "b", "c")
+    _stop_in_sub_task(tmp_path, [contents])
+
+    # e.g. a manual resync started after the job failed
+    checkpoint_mgr = _init_checkpoint(tmp_path, {**_TASK_OPTIONS, "run_id": "run-2"})
+    checkpoint_mgr.start_sub_task(0)
+    assert checkpoint_mgr.checkpoint is None
+    assert checkpoint_mgr.get_remaining_contents(contents) == (contents, 0)
+
+
+def test_page_is_received_once_the_next_page_is_asked_for(tmp_path):
+    contents = _make_contents("a", "b")
+    checkpoint_mgr = _init_checkpoint(tmp_path)
+    checkpoint_mgr.start_sub_task(0)
+    a, b = checkpoint_mgr.get_remaining_contents(contents)[0]
+
+    checkpoint_mgr.save_checkpoint(a, 100)
+    checkpoint_mgr.save_checkpoint(a, None)
+    assert _init_checkpoint(tmp_path).checkpoint is None
+
+    # the first page of b was asked for, so the last page of a was received
+    checkpoint_mgr.save_checkpoint(b, 100)
+    checkpoint_mgr = _init_checkpoint(tmp_path)
+    checkpoint_mgr.start_sub_task(0)
+    assert checkpoint_mgr.get_remaining_contents(contents) == ([b], 0)
@@ -0,0 +1,246 @@
+import io
+import json
+import random
+import time
+from concurrent.futures import Future
+from functools import partial
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from conftest import BUCKET
+from plugin.connector.aws_s3_connector import AWSS3Connector
+from plugin.manager.cost_manager import (
+    CostManager,
+    _COST_DATA_COLUMNS,
+    _PageSizer,
+    _aggregate_cost_tables,
+    _decode_cost_object,
+    _iter_pages,
+    _prefetch_in_order,
+)
+
+_ACCOUNT_ID = "123456789012"
+_DATABASE = "TEST"
+_MONTH = "2024-01"
+_SECRET_DATA = {
+    "aws_access_key_id": "testing",
+    "aws_secret_access_key": "testing",
+    "aws_s3_bucket": BUCKET,
+    "region_name": "us-east-1",
+}
+
+
+def _make_billing_parquet(rows: int, row_group_size: int) -> bytes:
+    rng = random.Random(0)
+    table = pa.table(
+        {
+            "usage_date": [f"{_MONTH}-{rng.randint(1, 28):02d}" for _ in range(rows)],
+            "region": [rng.choice(["APN2", "USE1", "EU", ""]) for _ in range(rows)],
+            "service_code": [
+                rng.choice(["AmazonEC2", "AWSDataTransfer", "Credit"])
+                for _ in range(rows)
+            ],
+            "usage_type": [
+                rng.choice(["APN2-DataTransfer-Out-Bytes", "BoxUsage:t3.large"])
+                for _ in range(rows)
+            ],
+            "instance_type": [rng.choice(["t3.large", None]) for _ in range(rows)],
+            "usage_quantity": [rng.random() for _ in range(rows)],
+            "usage_cost": [rng.random() for _ in range(rows)],
+            "tags": [
+                rng.choice(['{"user:Name": "a"}', '{"user:Role": "b"}', None])
+                for _ in range(rows)
+            ],
+        }
+    )
+    body = io.BytesIO()
+    pq.write_table(table, body, row_group_size=row_group_size)
+    return body.getvalue()
+
+
+def _make_expected_records(data: bytes, include_credit: bool) -> list:
+    cost_mgr = CostManager()
+    row_filter = cost_mgr._make_row_filter(include_credit)
+    batches = AWSS3Connector.read_cost_batches(
+        pa.BufferReader(data), _COST_DATA_COLUMNS, row_filter
+    )
+    table = pa.Table.from_batches(list(batches))
+    return cost_mgr._make_cost_data(table, _ACCOUNT_ID, include_credit)["results"]
+
+
+def test_decode_cost_object_with_many_row_groups():
+    data = _make_billing_parquet(10000, 1000)
+    row_filter = CostManager._make_row_filter(False)
+
+    pages = _decode_cost_object(data, _COST_DATA_COLUMNS, row_filter, False)
+
+    table = pa.ipc.open_stream(pages).read_all()
+    assert table.num_rows > 2000
+    records = CostManager._convert_to_cost_records(table, _ACCOUNT_ID)
+    assert records == _make_expected_records(data, False)
+
+
+def test_get_data_with_decode_processes(s3_client):
+    data = _make_billing_parquet(10000, 1000)
+    path = AWSS3Connector.get_month_path(_DATABASE, _ACCOUNT_ID, _MONTH)
+    s3_client.put_object(Bucket=BUCKET, Key=f"{path}/part-00000.parquet", Body=data)
+
+    options = {"decode_processes": 2}
+    task_options = {
+        "task_type": "directory",
+        "start": _MONTH,
+        "end": _MONTH,
+        "account_id": _ACCOUNT_ID,
+        "database": _DATABASE,
+        "is_sync": "true",
+    }
+
+    records = []
+    for page in CostManager().get_data(options, _SECRET_DATA, task_options):
+        records.extend(page["results"])
+
+    assert records == _make_expected_records(data, True)
+
+
+def test_pages_stay_under_max_bytes_with_dictionary_tags():
+    rows = 20000
+    tags = [
+        json.dumps({f"user:Key{index}": f"{value}-" + "v" * 60 for index in range(25)})
+        for value in range(50)
+    ]
+    data = _make_billing_parquet(rows, rows)
+    table = pq.read_table(io.BytesIO(data))
+    table = table.set_column(
+        table.column_names.index("tags"),
+        "tags",
+        pa.array([tags[index % len(tags)] for index in range(rows)]),
+    )
+    batches = AWSS3Connector.read_cost_batches(
+        pa.BufferReader(_write_parquet(table)), _COST_DATA_COLUMNS
+    )
+
+    max_bytes = 1024 * 1024
+    cost_mgr = CostManager()
+    page_sizer = _PageSizer(max_bytes, 0, 100, 20000)
+    make_page = partial(
+        cost_mgr._make_cost_data, account_id=_ACCOUNT_ID, include_credit=True
+    )
+    page_sizes = []
+    for _, page in _iter_pages(batches, page_sizer, make_page):
+        page_sizes.append(len(json.dumps(page["results"], default=dict)))
+
+    assert sum(page_sizes) > max_bytes * 10
+    # the first page too, before any page was measured
+    assert max(page_sizes) < max_bytes * 1.2
+
+
+def _write_parquet(table: pa.Table) -> bytes:
+    body = io.BytesIO()
+    pq.write_table(table, body)
+    return body.getvalue()
+
+
+def test_plan_months_lists_the_open_year_again(s3_client, monkeypatch):
+    # 2024-06 and later are still open
+    monkeypatch.setattr(
+        CostManager, "is_closed_month", staticmethod(lambda date: date < "2024-06")
+    )
+    account_id = "210987654321"
+    for month in ["2023-01", "2024-01"]:
+        path = AWSS3Connector.get_month_path(_DATABASE, account_id, month)
+        s3_client.put_object(Bucket=BUCKET, Key=f"{path}/part-00000.parquet")
+
+    cost_mgr = CostManager()
+    cost_mgr.aws_s3_connector.s3_client = s3_client
+    cost_mgr.aws_s3_connector.s3_bucket = BUCKET
+    date_ranges = ["2023-01", "2023-02", "2024-01", "2024-02", "2024-06"]
+
+    planned_ranges = cost_mgr._plan_months(_DATABASE, account_id, date_ranges)
+    assert planned_ranges == ["2023-01", "2024-01", "2024-06"]
+
+    # backfilled after the first listing
+    for month in ["2023-02", "2024-02"]:
+        path = AWSS3Connector.get_month_path(_DATABASE, account_id, month)
+        s3_client.put_object(Bucket=BUCKET, Key=f"{path}/part-00000.parquet")
+
+    planned_ranges = cost_mgr._plan_months(_DATABASE, account_id, date_ranges)
+    # 2023 is closed and still cached
+    assert planned_ranges == ["2023-01", "2024-01", "2024-02", "2024-06"]
+
+
+def test_prefetch_counts_the_size_of_opened_objects():
+    contents = [{"Key": f"{index}", "Size": 10} for index in range(5)]
+    submitted = []
+
+    def _submit(content):
+        # decoded to 100 bytes as soon as it is submitted
+        submitted.append(content["Key"])
+        future = Future()
+        future.set_result(pa.BufferReader(b"0" * 100))
+        return future
+
+    prefetched = _prefetch_in_order(
+        contents, _submit, 4, 150, lambda pages: pages.size()
+    )
+    assert next(prefetched)[0]["Key"] == "0"
+    # 10 bytes listed would fit four objects, 100 decoded bytes only one
+    assert submitted == ["0"]
+
+    keys = ["0"] + [content["Key"] for content, _ in prefetched]
+    assert keys == ["0", "1", "2", "3", "4"]
+
+    # without get_result_size the listed size is counted
+    submitted.clear()
+    next(_prefetch_in_order(contents, _submit, 4, 150))
+    assert submitted == ["0", "1", "2", "3"]
+
+
+def test_model_output_is_the_same_as_dict():
+    data = _make_billing_parquet(2000, 2000)
+    table = CostManager._transform_cost_table(pq.read_table(io.BytesIO(data)), True)
+
+    models = CostManager._convert_to_cost_records(table, _ACCOUNT_ID, "model")
+
+    records = CostManager._convert_to_cost_records(table, _ACCOUNT_ID)
+    assert [model.dict(include=set(records[0])) for model in models] == records
+
+
+def test_slow_consumer_does_not_shrink_pages():
+    batches = [pa.record_batch({"a": list(range(1000))}) for _ in range(10)]
+    page_sizer = _PageSizer(1024 * 1024 * 1024, 0.05, 100, 2000)
+
+    page_rows = []
+    for table, _ in _iter_pages(batches, page_sizer, lambda table: None):
+        page_rows.append(table.num_rows)
+        # the server waits for the client, much longer than target_seconds
+        time.sleep(0.1)
+
+    assert page_rows == [2000] * 5
+
+
+def test_aggregation_never_sums_different_usage_types():
+    table = pa.table(
+        {
+            "usage_date": [f"{_MONTH}-01"] * 4,
+            "region": ["APN2"] * 4,
+            "service_code": ["AmazonEC2"] * 4,
+            "usage_type": ["APN2-BoxUsage:t3.large"] * 2 + ["APN2-EBS:VolumeUsage"] * 2,
+            "instance_type": ["t3.large", "t3.large", None, None],
+            "usage_quantity": [12.0, 12.0, 60.0, 40.0],
+            "usage_cost": [1.0, 1.0, 2.0, 3.0],
+            "tags": [None] * 4,
+        }
+    )
+    options = {"aggregate_keys": ["billed_date", "region_code", "product"]}
+
+    group_columns = CostManager._get_group_columns(options)
+    tables = _aggregate_cost_tables(
+        [CostManager._transform_cost_table(table, True)], group_columns
+    )
+    records = CostManager._convert_to_cost_records(tables[0], _ACCOUNT_ID)
+
+    assert [
+        (record["usage_type"], record["usage_quantity"], record["cost"])
+        for record in records
+    ] == [("APN2-BoxUsage:t3.large", 24.0, 2.0), ("APN2-EBS:VolumeUsage", 100.0, 5.0)]
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+
+from conftest import BUCKET
+from plugin.connector.aws_s3_connector import AWSS3Connector
+from plugin.manager.job_manager import JobManager
+
+_SECRET_DATA = {
+    "aws_access_key_id": "testing",
+    "aws_secret_access_key": "testing",
+    "aws_s3_bucket": BUCKET,
+    "region_name": "us-east-1",
+}
+
+
+def test_tasks_of_a_job_share_a_new_run_id(s3_client):
+    month = (datetime.utcnow() - relativedelta(months=1)).strftime("%Y-%m")
+    for account_id in ["111111111111", "222222222222"]:
+        path = AWSS3Connector.get_month_path("TEST", account_id, month)
+        s3_client.put_object(Bucket=BUCKET, Key=f"{path}/part-00000.parquet", Body=b"1")
+
+    options = {"database": "TEST"}
+    tasks = JobManager().get_tasks_directory_type("domain-1", options, _SECRET_DATA)[
+        "tasks"
+    ]
+
+    run_ids = {task["task_options"]["run_id"] for task in tasks}
+    assert len(tasks) == 2 and len(run_ids) == 1
+
+    # a later job, e.g. a manual resync, does not resume the checkpoints
+    tasks = JobManager().get_tasks_directory_type("domain-1", options, _SECRET_DATA)[
+        "tasks"
+    ]
+    assert tasks[0]["task_options"]["run_id"] not in run_ids
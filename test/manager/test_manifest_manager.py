@@ -0,0 +1,121 @@
+import time
+from datetime import datetime, timezone
+
+from dateutil.relativedelta import relativedelta
+
+from conftest import BUCKET
+from plugin.connector.aws_s3_connector import AWSS3Connector
+from plugin.manager.manifest_manager import ManifestManager
+
+_PATH = "SPACE_ONE/billing/database=TEST/account_id=123456789012/year=2024/month=01"
+_LAST_MODIFIED = datetime(2024, 2, 1, tzinfo=timezone.utc)
+_SYNCED_AT = datetime(2024, 2, 2, tzinfo=timezone.utc).timestamp()
+
+
+def _make_contents(*keys: str, etag: str = '"1"') -> list:
+    return [
+        {
+            "Key": f"{_PATH}/{key}",
+            "ETag": etag,
+            "Size": 100,
+            "LastModified": _LAST_MODIFIED,
+        }
+        for key in keys
+    ]
+
+
+def _init_manifest(tmp_path, contents: list, synced_at: float) -> ManifestManager:
+    manifest_mgr = ManifestManager()
+    manifest_mgr.init_store({"state_store_path": str(tmp_path)})
+    manifest_mgr.update_manifest(BUCKET, _PATH, contents, synced_at)
+    return manifest_mgr
+
+
+def _is_synced(manifest_mgr: ManifestManager, contents: list) -> bool:
+    # the data source was last synchronized a day after the manifest was written
+    synced_before = _SYNCED_AT + 24 * 60 * 60
+    return manifest_mgr._is_synced(BUCKET, _PATH, contents, synced_before)
+
+
+def test_unchanged_objects_are_synced(tmp_path):
+    contents = _make_contents("a.parquet", "b.parquet")
+    manifest_mgr = _init_manifest(tmp_path, contents, _SYNCED_AT)
+
+    assert _is_synced(manifest_mgr, _make_contents("b.parquet", "a.parquet"))
+
+
+def test_changed_etag_is_not_synced(tmp_path):
+    contents = _make_contents("a.parquet", "b.parquet")
+    manifest_mgr = _init_manifest(tmp_path, contents, _SYNCED_AT)
+
+    changed_contents = contents[:1] + _make_contents("b.parquet", etag='"2"')
+    assert not _is_synced(manifest_mgr, changed_contents)
+
+
+def test_removed_or_added_object_is_not_synced(tmp_path):
+    contents = _make_contents("a.parquet", "b.parquet")
+    manifest_mgr = _init_manifest(tmp_path, contents, _SYNCED_AT)
+
+    assert not _is_synced(manifest_mgr, contents[:1])
+    assert not _is_synced(manifest_mgr, contents + _make_contents("c.parquet"))
+    assert not _is_synced(manifest_mgr, [])
+
+
+def test_entry_written_after_last_synchronized_at_is_not_synced(tmp_path):
+    contents = _make_contents("a.parquet")
+    manifest_mgr = _init_manifest(tmp_path, contents, _SYNCED_AT)
+
+    # written by a task of a job that did not complete
+    assert not manifest_mgr._is_synced(BUCKET, _PATH, contents, _SYNCED_AT)
+    assert not manifest_mgr._is_synced(BUCKET, _PATH, contents, _SYNCED_AT - 1)
+
+
+def test_update_manifest_keeps_the_first_synced_at_of_unchanged_objects(tmp_path):
+    contents = _make_contents("a.parquet", "b.parquet")
+    manifest_mgr = _init_manifest(tmp_path, contents, _SYNCED_AT)
+
+    # synced again after b.parquet was rewritten
+    synced_at = _SYNCED_AT + 48 * 60 * 60
+    changed_contents = contents[:1] + _make_contents("b.parquet", etag='"2"')
+    manifest_mgr.update_manifest(BUCKET, _PATH, changed_contents, synced_at)
+
+    manifest = manifest_mgr.state_store_connector.get("manifest", f"{BUCKET}/{_PATH}")
+    assert manifest[f"{_PATH}/a.parquet"]["synced_at"] == _SYNCED_AT
+    assert manifest[f"{_PATH}/b.parquet"]["synced_at"] == synced_at
+    assert not _is_synced(manifest_mgr, contents)
+
+
+def test_get_first_changed_month(s3_client, tmp_path):
+    aws_s3_connector = AWSS3Connector()
+    aws_s3_connector.s3_client = s3_client
+    aws_s3_connector.s3_bucket = BUCKET
+
+    manifest_mgr = ManifestManager()
+    manifest_mgr.init_store({"state_store_path": str(tmp_path)})
+
+    now = datetime.utcnow()
+    months = [
+        (now - relativedelta(months=months_ago)).strftime("%Y-%m")
+        for months_ago in [2, 1, 0]
+    ]
+    synced_at = time.time() - 60 * 60
+    for month in months:
+        path = AWSS3Connector.get_month_path("TEST", "123456789012", month)
+        s3_client.put_object(Bucket=BUCKET, Key=f"{path}/part-00000.parquet", Body=b"1")
+        contents = aws_s3_connector.list_objects(path)["Contents"]
+        manifest_mgr.update_manifest(BUCKET, path, contents, synced_at)
+
+    last_synchronized_at = datetime.now(timezone.utc)
+    first_changed_month = manifest_mgr.get_first_changed_month(
+        aws_s3_connector, "TEST", "123456789012", months[0], last_synchronized_at
+    )
+    assert first_changed_month is None
+
+    # rewritten after the last sync
+    path = AWSS3Connector.get_month_path("TEST", "123456789012", months[1])
+    s3_client.put_object(Bucket=BUCKET, Key=f"{path}/part-00000.parquet", Body=b"2")
+
+    first_changed_month = manifest_mgr.get_first_changed_month(
+        aws_s3_connector, "TEST", "123456789012", months[0], last_synchronized_at
+    )
+    assert first_changed_month == months[1]
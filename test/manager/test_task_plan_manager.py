@@ -0,0 +1,142 @@
+from conftest import BUCKET
+from plugin.connector.aws_s3_connector import AWSS3Connector
+from plugin.manager.task_plan_manager import TaskPlanManager
+
+_DATABASE = "TEST"
+
+
+def _make_task(account_id: str, start: str, end: str = None) -> dict:
+    task_options = {
+        "account_id": account_id,
+        "database": _DATABASE,
+        "start": start,
+        "is_sync": "true",
+        "task_type": "directory",
+    }
+    task_changed = {
+        "start": start,
+        "filter": {"additional_info.Account ID": account_id},
+    }
+    if end:
+        task_options["end"] = end
+        task_changed["end"] = end
+
+    return {"task_options": task_options, "task_changed": task_changed}
+
+
+def test_split_task():
+    task = _make_task("111111111111", "2024-01")
+    month_sizes = [("2024-01", 60), ("2024-02", 60), ("2024-03", 30), ("2024-04", 90)]
+
+    split_tasks = TaskPlanManager._split_task(task, month_sizes, 100)
+
+    assert [
+        (split_task["task_options"]["start"], split_task["task_options"].get("end"))
+        for split_task in split_tasks
+    ] == [("2024-01", "2024-01"), ("2024-02", "2024-03"), ("2024-04", None)]
+
+    # every split task only replaces the data of its own months and account
+    for split_task in split_tasks:
+        task_options = split_task["task_options"]
+        task_changed = split_task["task_changed"]
+        assert task_changed["start"] == task_options["start"]
+        assert task_changed.get("end") == task_options.get("end")
+        assert task_changed["filter"] == {"additional_info.Account ID": "111111111111"}
+
+    assert task["task_options"]["start"] == "2024-01"
+    assert "end" not in task["task_options"]
+
+
+def test_split_task_keeps_the_end_of_the_task():
+    task = _make_task("111111111111", "2024-01", "2024-02")
+    month_sizes = [("2024-01", 60), ("2024-02", 60)]
+
+    split_tasks = TaskPlanManager._split_task(task, month_sizes, 100)
+
+    assert [
+        (split_task["task_changed"]["start"], split_task["task_changed"]["end"])
+        for split_task in split_tasks
+    ] == [("2024-01", "2024-01"), ("2024-02", "2024-02")]
+
+
+def test_make_batches():
+    tasks = [_make_task(f"{index}" * 12, "2024-01") for index in range(1, 5)]
+    small_tasks = list(zip(tasks, [40, 50, 20, 90]))
+
+    batches = TaskPlanManager._make_batches(small_tasks, 100)
+
+    assert batches == [tasks[:2], tasks[2:3], tasks[3:]]
+
+
+def test_merge_tasks_with_the_same_task_changed():
+    tasks = [
+        _make_task("111111111111", "2024-03"),
+        _make_task("222222222222", "2024-01"),
+    ]
+    for task in tasks:
+        task["task_changed"] = {"start": "2024-01"}
+
+    batch_task, changed = TaskPlanManager._merge_tasks(tasks)
+
+    assert batch_task["task_options"]["start"] == "2024-01"
+    assert batch_task["task_options"]["sub_tasks"] == [
+        task["task_options"] for task in tasks
+    ]
+    assert batch_task["task_changed"] == {"start": "2024-01"}
+    assert changed == []
+
+
+def test_merge_tasks_with_mixed_filters_moves_them_to_the_job():
+    tasks = [
+        _make_task("111111111111", "2024-03"),
+        _make_task("222222222222", "2024-01"),
+    ]
+
+    batch_task, changed = TaskPlanManager._merge_tasks(tasks)
+
+    # one task_changed can not filter two accounts
+    assert "task_changed" not in batch_task
+    assert batch_task["task_options"]["start"] == "2024-01"
+    assert changed == [task["task_changed"] for task in tasks]
+
+
+def test_merge_tasks_with_one_task():
+    task = _make_task("111111111111", "2024-01")
+
+    assert TaskPlanManager._merge_tasks([task]) == (task, [])
+
+
+def test_plan_tasks(s3_client):
+    aws_s3_connector = AWSS3Connector()
+    aws_s3_connector.s3_client = s3_client
+    aws_s3_connector.s3_bucket = BUCKET
+
+    sizes = {
+        "111111111111": {"2024-01": 60, "2024-02": 60},
+        "222222222222": {"2024-01": 10},
+        "333333333333": {"2024-02": 20},
+    }
+    tasks = []
+    for account_id, month_sizes in sizes.items():
+        for month, size in month_sizes.items():
+            path = AWSS3Connector.get_month_path(_DATABASE, account_id, month)
+            s3_client.put_object(
+                Bucket=BUCKET, Key=f"{path}/part-00000.parquet", Body=b"0" * size
+            )
+
+        tasks.append(_make_task(account_id, "2024-01", "2024-02"))
+
+    planned_tasks, changed = TaskPlanManager().plan_tasks(
+        aws_s3_connector, tasks, 100
+    )
+
+    assert [task["task_options"].get("account_id") for task in planned_tasks] == [
+        "111111111111",
+        "111111111111",
+        None,
+    ]
+    batch_task = planned_tasks[-1]
+    assert [
+        sub_task["account_id"] for sub_task in batch_task["task_options"]["sub_tasks"]
+    ] == ["222222222222", "333333333333"]
+    assert changed == [tasks[1]["task_changed"], tasks[2]["task_changed"]]